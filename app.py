@@ -2,24 +2,47 @@
 E-commerce CRUD app
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, abort, stream_with_context, render_template, stream_template, request, redirect, url_for, session, flash, jsonify
 from flask_httpauth import HTTPBasicAuth
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
+from werkzeug.middleware.proxy_fix import ProxyFix
 import secrets
-import uuid
-import datetime
-import stripe
 import os
+import uuid
+import db
+import metrics
+import migrate
+import catalog
+import search_index
+import reviews
+import cart
+import checkout as checkout_service
+import payments
+import images
+import pagecache
+import orders
+import bulk
+import passwords
+from db import MAX_INTEGER, query, execute
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex() # Generate a random secret key
+# Workers must share the key to read each other's sessions; random if unset
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex()
+# Number of reverse proxies in front of the app; their X-Forwarded-For gives the
+# client address the login limits count, instead of the proxy's own
+app.config.setdefault('TRUSTED_PROXIES', int(os.environ.get('TRUSTED_PROXIES', '0')))
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
 auth = HTTPBasicAuth()
-
-try:
-    stripe.api_key = os.environ['STRIPE_SECRET_KEY']
-except:
-    stripe.api_key = None
+db.init_app(app)
+metrics.init_app(app)
+migrate.init_app(app)
+search_index.init_app(app)
+cart.init_app(app)
+payments.init_app(app)
+images.init_app(app)
+pagecache.init_app(app)
+bulk.init_app(app)
+passwords.init_app(app)
 
 YOUR_DOMAIN = 'http://localhost:5000'
 
@@ -30,14 +53,16 @@ def sgd(value):
 # Custom Jinja filter
 app.jinja_env.filters["sgd"] = sgd
 
+def payments_gateway():
+    return app.extensions['payment_gateway']
+
 users = {
-    "admin": generate_password_hash("admin")
+    "admin": passwords.hash_password("admin")
 }
 
 @auth.verify_password
 def verify_password(username, password):
-    if username in users and \
-            check_password_hash(users.get(username), password):
+    if passwords.verify_basic(username, password, users.get(username), request.remote_addr):
         return username
 
 @app.route('/')
@@ -48,24 +73,27 @@ def index():
 @app.route('/view_orders')
 def view_orders():
     if 'username' in session:
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM Orders WHERE user_id = ?', (session['username'],))
-            orders = cursor.fetchall()
-        return render_template('orders.html', orders=orders)
+        page, next_before = orders.get_page(session['username'], request.args.get('before'), request.args.get('limit', type=int))
+        return render_template('orders.html', orders=page, next_before=next_before)
     else:
         return redirect(url_for('login'))
 
+@app.route('/api/orders')
+def api_orders():
+    """A page of the customer's order summaries, newest first; pass next_before back as ?before= for the next."""
+    if 'username' not in session:
+        return jsonify(error='Login required'), 401
+    page, next_before = orders.get_page(session['username'], request.args.get('before'), request.args.get('limit', type=int))
+    return jsonify(orders=[dict(order) for order in page], next_before=next_before)
+
 @app.route('/order/<string:order_id>')
 def order(order_id):
     if 'username' in session:
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT i.name, i.price, oi.qty FROM Order_Items oi INNER JOIN Items i ON oi.item_id = i.item_id WHERE order_id = ?', (order_id,))
-            order_items = cursor.fetchall()
-        return render_template('order.html', order_items=order_items, order_id=order_id)
+        found = orders.get_order(session['username'], order_id)
+        if found is None:
+            abort(404)
+        summary, order_items = found
+        return render_template('order.html', order=summary, order_items=order_items, order_id=order_id)
     else:
         return redirect(url_for('login'))
 
@@ -73,11 +101,7 @@ def order(order_id):
 def review():
     # Query DB to get items user ordered before
     if 'username' in session:
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT DISTINCT i.name, i.item_id FROM Order_Items oi INNER JOIN Items i ON oi.item_id = i.item_id INNER JOIN Orders o ON o.order_id = oi.order_id WHERE o.user_id = ?', (session['username'],))
-            items = cursor.fetchall()
+        items = query('SELECT DISTINCT i.name, i.item_id FROM Order_Items oi INNER JOIN Items i ON oi.item_id = i.item_id INNER JOIN Orders o ON o.order_id = oi.order_id WHERE o.user_id = ?', (session['username'],))
         return render_template('review.html', items=items)
     else:
         return redirect(url_for('login'))
@@ -92,162 +116,124 @@ def review_item(item_id):
             flash('Rating must be between 1 and 5', 'error')
             return redirect(url_for('review_item', item_id=item_id))
         # Add review to database
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO Reviews (item_id, user_id, rating, review) VALUES (?, ?, ?, ?)', (item_id, session['username'], rating, review))
-            conn.commit()
+        reviews.add_review(item_id, session['username'], rating, review)
         return redirect(url_for('product', id=item_id))
     else:
         return render_template('review_item.html', item_id=item_id)
 
 @app.route('/catalog')
+@pagecache.conditional('catalog', 'reviews')
 def products():
     # Get items from database
-    with sqlite3.connect('db.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Items')
-        products = cursor.fetchall()
-    return render_template('catalog.html', products=products)
+    sort = catalog.parse_sort(request.args.get('sort'))
+    products, next_cursor = catalog.get_page(sort, request.args.get('after'), request.args.get('limit', type=int))
+    stats = reviews.get_stats_for(product['item_id'] for product in products)
+    return render_template('catalog.html', products=products, stats=stats, sort=sort, next_cursor=next_cursor)
 
 @app.route('/product/<int:id>')
+@pagecache.conditional('catalog', 'reviews')
 def product(id):
     # Get specific item from database
-    with sqlite3.connect('db.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Items WHERE item_id = ?', (id,))
-        product = cursor.fetchone()
-        # Get reviews
-        cursor.execute('SELECT * FROM Reviews WHERE item_id = ?', (id,))
-        reviews = cursor.fetchall()
-    return render_template('product.html', product=product, reviews=reviews)
-
-@app.route('/add_to_cart/<int:item_id>')
+    product = catalog.get_item(id)
+    if product is None:
+        abort(404)
+    # Get rating summary and the newest page of reviews
+    stats = reviews.get_stats(id)
+    page, next_before = reviews.get_page(id, request.args.get('before', type=int))
+    return render_template('product.html', product=product, stats=stats, reviews=page, next_before=next_before)
+
+@app.route(f'/add_to_cart/<int(max={MAX_INTEGER}):item_id>')
 def add_to_cart(item_id):
-    item_id = int(item_id)
-
-    if 'cart' not in session:
-        session['cart'] = {}
-    session['cart'][item_id] = session['cart'].get(item_id, 0) + 1
-
-    # Update cart in db if logged in
-    if 'username' in session:
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            # Check if item is already in cart
-            cursor.execute('SELECT * FROM Cart WHERE user_id = ? AND item_id = ?', (session['username'], item_id))
-            cart_item = cursor.fetchone()
-            if cart_item:
-                cursor.execute('UPDATE Cart SET qty = ? WHERE user_id = ? AND item_id = ?', (cart_item[2] + 1, session['username'], item_id))
-            else:
-                cursor.execute('INSERT INTO Cart (user_id, item_id, qty) VALUES (?, ?, ?)', (session['username'], item_id, 1))
-            conn.commit()
-        return redirect(url_for('view_cart'))
-    else:
-        return redirect(url_for('login'))
+    cart.add(cart.current_owner(session), {item_id: 1})
+    return redirect(url_for('view_cart'))
 
 
 @app.route('/view_cart')
 def view_cart():
-
-    if 'username' in session:
-        # load cart from db
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT i.item_id, i.name, i.price, c.qty FROM Cart c INNER JOIN Items i ON c.item_id = i.item_id WHERE user_id = ?', (session['username'],))
-            cart = cursor.fetchall()
-            
-        return render_template('cart.html', cart=cart)
-    else:
-        return redirect(url_for('login'))
+    items = cart.items(cart.current_owner(session))
+    return render_template('cart.html', cart=items)
 
 @app.route('/remove_from_cart/<int:item_id>')
 def remove_from_cart(item_id):
-    item_id = int(item_id)
-    # Remove from db if logged in
-    if 'username' in session:
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM Cart WHERE user_id = ? AND item_id = ?', (session['username'], item_id))
-            conn.commit()
+    cart.remove(cart.current_owner(session), [item_id])
     return redirect(url_for('view_cart'))
 
+def cart_json(owner):
+    items = cart.items(owner)
+    return jsonify(
+        items=[dict(item) for item in items],
+        total=sum(item['price'] * item['qty'] for item in items),
+    )
+
+@app.route('/api/cart')
+def api_cart():
+    return cart_json(cart.current_owner(session))
+
+@app.route('/api/cart/items', methods=['POST', 'PUT', 'DELETE'])
+def api_cart_items():
+    """POST adds to the quantities in {"items": [{"item_id", "qty"}]}, PUT sets them (0 removes), DELETE removes the listed items."""
+    owner = cart.current_owner(session)
+    try:
+        # Only PUT may set a quantity to 0, which removes the item
+        quantities = cart.parse_quantities(request.get_json(silent=True), minimum=0 if request.method == 'PUT' else 1)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if request.method == 'POST':
+        cart.add(owner, quantities)
+    elif request.method == 'PUT':
+        cart.update(owner, quantities)
+    else:
+        cart.remove(owner, quantities.keys())
+    return cart_json(owner)
+
 @app.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if request.method == 'POST':
+        if 'username' not in session:
+            return redirect(url_for('login'))
         # Get form data
         name = request.form['name']
         email = request.form['email']
         address = request.form['address']
         phone = request.form['phone']
-        # Add order to database
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            # Generate Unique Order ID
-            ORDER_ID = uuid.uuid4().hex
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO Orders (order_id, user_id, shipping_address, phone, order_date) VALUES (?, ?, ?, ?, ?)', (ORDER_ID, session['username'], address, phone, datetime.datetime.now()))
-            # Add order items to database
-            cursor.execute('SELECT item_id, qty FROM Cart WHERE user_id = ?', (session['username'],))
-            cart = cursor.fetchall()
-            for item in cart:
-                cursor.execute('INSERT INTO Order_Items (order_id, item_id, qty) VALUES (?, ?, ?)', (ORDER_ID, item[0], item[1]))
-            
-            cursor.execute('SELECT i.item_id, i.name, i.price, c.qty FROM Cart c INNER JOIN Items i ON c.item_id = i.item_id WHERE user_id = ?', (session['username'],))
-            cart_detailed = cursor.fetchall()
-            total = sum([item['price'] * item['qty'] for item in cart_detailed])
+        # Resubmitting the same form returns the order it already created
+        idempotency_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        try:
+            order_id, total = checkout_service.place_order(session['username'], address, phone, idempotency_key)
+        except checkout_service.EmptyCartError:
+            flash('Your cart is empty', 'error')
+            return redirect(url_for('view_cart'))
 
-            # Clear cart
-            cursor.execute('DELETE FROM Cart WHERE user_id = ?', (session['username'],))
-            conn.commit()
-        
+        # Payment happens after the order transaction has committed
         try:
-            if stripe.api_key is None:
-                raise Exception('Stripe API key not set')
-            checkout_session = stripe.checkout.Session.create(
-            line_items=[
-                {
-                    # Provide the exact Price ID (for example, pr_1234) of the product you want to sell
-                    'price_data': {
-                        'currency': 'sgd',
-                        'product': 'prod_Pb3YILaur4mxxM',
-                        'unit_amount': int(total * 100)
-
-                    },
-                    'quantity': 1,
-                },
-            ],
-            mode='payment',
-            success_url=YOUR_DOMAIN + '/success',
-            cancel_url=YOUR_DOMAIN + '/cancel',
-            )
-            return redirect(checkout_session.url, code=303)
-
-        except Exception as e:
+            with metrics.external('payment'):
+                payment_url = payments_gateway().create_session(order_id, total, YOUR_DOMAIN + '/success', YOUR_DOMAIN + '/cancel')
+            return redirect(payment_url, code=303)
+        except payments.PaymentError as e:
             # Silently ignore the error
             print(e)
             return redirect(url_for('index'))
-
-        
-        # redirect(url_for('index'))
     else:
         # Get cart items details from database
         if 'username' in session:
-            with sqlite3.connect('db.db') as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute('SELECT i.item_id, i.name, i.price, c.qty FROM Cart c INNER JOIN Items i ON c.item_id = i.item_id WHERE user_id = ?', (session['username'],))
-                cart_detailed = cursor.fetchall()
-                total = sum([item['price'] * item['qty'] for item in cart_detailed])
+            cart_detailed = cart.items(cart.current_owner(session))
+            total = sum([item['price'] * item['qty'] for item in cart_detailed])
             if total == 0:
                 flash('Your cart is empty', 'error')
                 return redirect(url_for('view_cart'))
-            return render_template('checkout.html', cart=cart_detailed, total=total)
+            return render_template('checkout.html', cart=cart_detailed, total=total, idempotency_key=uuid.uuid4().hex)
         else:
             return redirect(url_for('login'))
 
+@app.route('/media/<path:filename>')
+def media(filename):
+    return images.serve(filename)
+
+@app.route('/metrics')
+@auth.login_required
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/success')
 def success():
     return render_template('success.html')
@@ -257,25 +243,30 @@ def cancel():
     return render_template('cancel.html')
 
 @app.route('/search', methods=['GET'])
+@pagecache.conditional('catalog')
 def search():
-    query = request.args.get('query')
-    with sqlite3.connect('db.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Items WHERE name LIKE ?', ('%' + query + '%',))
-        products = cursor.fetchall()
-    return render_template('search.html', products=products)
+    search_query = request.args.get('query', '')
+    page = min(max(request.args.get('page', 1, type=int), 1), search_index.MAX_PAGE)
+    products, has_more = search_index.search(search_query, page)
+    return render_template('search.html', products=products, query=search_query, page=page, has_more=has_more)
 
 @app.route('/admin')
 @auth.login_required
 def admin():
     # Get items from database
-    with sqlite3.connect('db.db') as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Items')
-        products = cursor.fetchall()
-    return render_template('admin.html', products=products)
+    sort = catalog.parse_sort(request.args.get('sort'))
+    if request.args.get('stream'):
+        # Render the whole listing as it is read, without holding it in memory
+        return stream_template('admin.html', products=catalog.iter_items(sort), sort=sort, next_cursor=None)
+    products, next_cursor = catalog.get_page(sort, request.args.get('after'), request.args.get('limit', type=int))
+    return render_template('admin.html', products=products, sort=sort, next_cursor=next_cursor)
+
+def save_image_upload():
+    """Store the form's image, if one was chosen, and return (key, path) for images.submit."""
+    upload = request.files.get('image')
+    if upload and upload.filename:
+        return images.save_original(upload)
+    return None
 
 @app.route('/admin/add', methods=['GET', 'POST'])
 @auth.login_required
@@ -285,11 +276,16 @@ def add_product():
         name = request.form['name']
         price = float(request.form['price'])
         description = request.form['description']
+        try:
+            upload = save_image_upload()
+        except images.ImageError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('add_product'))
         # Add item to database
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO Items (name, price, description) VALUES (?, ?, ?)', (name, price, description))
-            conn.commit()
+        with catalog.changing() as conn:
+            item_id = conn.execute('INSERT INTO Items (name, price, description) VALUES (?, ?, ?)', (name, price, description)).lastrowid
+        if upload:
+            images.submit(item_id, *upload)
         return redirect(url_for('admin'))
     else:
         return render_template('add_product.html')
@@ -298,10 +294,8 @@ def add_product():
 @auth.login_required
 def remove_product(item_id):
     # Remove item from database
-    with sqlite3.connect('db.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM Items WHERE item_id = ?', (item_id,))
-        conn.commit()
+    with catalog.changing() as conn:
+        conn.execute('DELETE FROM Items WHERE item_id = ?', (item_id,))
     return redirect(url_for('admin'))
 
 @app.route('/admin/modify/<int:item_id>', methods=['GET', 'POST'])
@@ -312,21 +306,66 @@ def edit_product(item_id):
         name = str(request.form['name'])
         price = float(request.form['price'])
         description = str(request.form['description'])
+        try:
+            upload = save_image_upload()
+        except images.ImageError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('edit_product', item_id=item_id))
         # Update item in database
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('UPDATE Items SET name = ?, price = ?, description = ? WHERE item_id = ?', (name, price, description, item_id))
-            conn.commit()
+        with catalog.changing() as conn:
+            conn.execute('UPDATE Items SET name = ?, price = ?, description = ? WHERE item_id = ?', (name, price, description, item_id))
+        if upload:
+            images.submit(item_id, *upload)
         return redirect(url_for('admin'))
     else:
         # Get specific item from database
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM Items WHERE item_id = ?', (item_id,))
-            product = cursor.fetchone()
+        product = catalog.get_item(item_id)
         return render_template('edit_product.html', product=product, item_id=item_id)
 
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@auth.login_required
+def import_products():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a file to import', 'error')
+            return redirect(url_for('import_products'))
+        try:
+            job_id = bulk.start_import(upload, request.form.get('format'))
+        except ValueError as e:
+            if wants_json():
+                return jsonify(error=str(e)), 400
+            flash(str(e), 'error')
+            return redirect(url_for('import_products'))
+        if wants_json():
+            return jsonify(job_id=job_id, status_url=url_for('import_job', job_id=job_id)), 202
+        return redirect(url_for('import_job', job_id=job_id))
+    else:
+        return render_template('import.html', jobs=bulk.recent_jobs())
+
+@app.route('/admin/import/<string:job_id>')
+@auth.login_required
+def import_job(job_id):
+    """Progress of an import while it runs, and its report once finished."""
+    job = bulk.get_job(job_id)
+    if job is None:
+        abort(404)
+    if wants_json():
+        return jsonify(job)
+    return render_template('import_job.html', job=job)
+
+@app.route('/admin/export/<string:name>')
+@auth.login_required
+def export_table(name):
+    fmt = request.args.get('format', 'csv')
+    if name not in bulk.EXPORTS or fmt not in bulk.FORMATS:
+        abort(404)
+    return Response(stream_with_context(bulk.export(name, fmt)), mimetype=bulk.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -339,10 +378,7 @@ def register():
             flash('Passwords do not match', 'error')
             return redirect(url_for('register'))
         # Add user to database
-        with sqlite3.connect('db.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO Users (username, email, password) VALUES (?, ?, ?)', (username, email, generate_password_hash(password)))
-            conn.commit()
+        execute('INSERT INTO Users (username, email, password) VALUES (?, ?, ?)', (username, email, passwords.hash_password(password)))
         return redirect(url_for('index'))
     else:
         return render_template('register.html')
@@ -354,13 +390,13 @@ def login():
         username = request.form['username']
         password = request.form['password']
         # Check if user exists
-        with sqlite3.connect('db.db') as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM Users WHERE username = ?', (username,))
-            user = cursor.fetchone()
-        if user and check_password_hash(user['password'], password):
+        user = query('SELECT * FROM Users WHERE username = ?', (username,), one=True)
+        if passwords.login(username, password, user['password'] if user else None, request.remote_addr):
+            if passwords.needs_rehash(user['password']):
+                # Upgrade to the configured hashing cost while the password is at hand
+                execute('UPDATE Users SET password = ? WHERE user_id = ?', (passwords.hash_password(password), user['user_id']))
             session['username'] = username
+            cart.merge_guest_cart(session)
             return redirect(url_for('index'))
         else:
             return 'Invalid credentials'
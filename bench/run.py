@@ -0,0 +1,258 @@
+"""
+Benchmark the storefront flows
+
+    python -m bench.run bench.db --mode client --shoppers 8 --duration 20
+    python -m bench.run bench.db --mode server --workers 4 --shoppers 32 --duration 30
+
+Simulated shoppers log in, then loop over catalog, search, product,
+add_to_cart and view_cart, checking out every few rounds. "client" mode
+drives the app in-process through Flask's test client; "server" mode starts
+gunicorn and talks HTTP to it. The database is modified (orders are placed),
+so run against a copy made with bench.seed.
+
+Results are per route: p50/p95/p99 latency, throughput, server errors and
+waits for the SQLite write lock (from the X-DB-Lock-Waits header). Use
+--save-baseline NAME to store them in bench/baselines/NAME.json and
+--compare NAME to fail if a route got slower than the baseline.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from bench.seed import PASSWORD, WORDS
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment the app runs with under benchmark
+APP_ENV = {
+    'PAYMENT_GATEWAY': 'fake',
+    'DB_LOCK_STATS': '1',
+    'SECRET_KEY': 'benchmark',
+}
+
+CHECKOUT_EVERY = 5
+
+
+class ClientTransport:
+    """Requests through Flask's test client, in this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(), response.headers
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server, with a cookie jar per shopper."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, route, seconds, status, lock_waits):
+        with self.lock:
+            self.samples.setdefault(route, []).append((seconds, status, lock_waits))
+
+
+def timed(transport, recorder, route, method, path, data=None):
+    start = time.perf_counter()
+    status, body, headers = transport.request(method, path, data)
+    elapsed = time.perf_counter() - start
+    recorder.record(route, elapsed, status, int(headers.get('X-DB-Lock-Waits', 0)))
+    return status, body
+
+
+def shopper(n, transport, recorder, deadline, max_item_id, users):
+    rng = random.Random(n)
+    transport.request('POST', '/login', {'username': f'user{rng.randrange(users)}', 'password': PASSWORD})
+    rounds = 0
+    while time.monotonic() < deadline:
+        rounds += 1
+        sort = rng.choice(('id', '-id', 'price', '-price'))
+        timed(transport, recorder, 'catalog', 'GET', f'/catalog?sort={sort}')
+        timed(transport, recorder, 'catalog page', 'GET', f'/catalog?after={rng.randrange(max_item_id)}')
+        timed(transport, recorder, 'search', 'GET', f'/search?query={rng.choice(WORDS)}')
+        item_id = rng.randrange(1, max_item_id + 1)
+        timed(transport, recorder, 'product', 'GET', f'/product/{item_id}')
+        timed(transport, recorder, 'add_to_cart', 'GET', f'/add_to_cart/{item_id}')
+        timed(transport, recorder, 'view_cart', 'GET', '/view_cart')
+        if rounds % CHECKOUT_EVERY == 0:
+            status, body = timed(transport, recorder, 'checkout form', 'GET', '/checkout')
+            match = re.search(rb'name="idempotency_key" value="(\w+)"', body)
+            if status == 200 and match:
+                form = {'name': 'Bench', 'email': 'bench@example.com', 'address': 'Somewhere',
+                        'phone': '12345678', 'idempotency_key': match.group(1).decode()}
+                timed(transport, recorder, 'checkout', 'POST', '/checkout', form)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+        routes[route] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, status, _ in samples if status >= 500),
+            'lock_waits': sum(waits for _, _, waits in samples),
+            'throughput': len(samples) / elapsed,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {'elapsed': elapsed, 'requests': total, 'throughput': total / elapsed, 'routes': routes}
+
+
+def print_report(results):
+    print(f"{'route':<16}{'reqs':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'lock waits':>12}")
+    for route, stats in results['routes'].items():
+        print(f"{route:<16}{stats['requests']:>8}{stats['throughput']:>9.1f}{stats['p50_ms']:>9.2f}"
+              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['errors']:>8}{stats['lock_waits']:>12}")
+    print(f"{results['requests']} requests in {results['elapsed']:.1f}s, {results['throughput']:.1f} req/s")
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every route that regressed beyond tolerance."""
+    regressions = []
+    for route, base in baseline['routes'].items():
+        stats = results['routes'].get(route)
+        if stats is None:
+            regressions.append(f'{route}: no requests')
+            continue
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {stats['p95_ms']:.2f} ms vs baseline {base['p95_ms']:.2f} ms")
+        if stats['errors'] > base['errors']:
+            regressions.append(f"{route}: {stats['errors']} errors vs baseline {base['errors']}")
+    if results['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"throughput {results['throughput']:.1f} req/s vs baseline {baseline['throughput']:.1f} req/s")
+    return regressions
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path, workers, threads):
+    port = free_port()
+    env = dict(os.environ, DATABASE=os.path.abspath(path), **APP_ENV)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+         '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/').close()
+            return server, base_url
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run(args):
+    if args.mode == 'client':
+        os.environ.update(APP_ENV, DATABASE=os.path.abspath(args.path))
+        from app import app
+        make_transport = lambda: ClientTransport(app)
+        server = None
+    else:
+        server, base_url = start_server(args.path, args.workers, args.threads)
+        make_transport = lambda: HttpTransport(base_url)
+
+    import sqlite3
+    with sqlite3.connect(args.path) as conn:
+        max_item_id = conn.execute('SELECT MAX(item_id) FROM Items').fetchone()[0]
+        users = conn.execute('SELECT COUNT(*) FROM Users').fetchone()[0]
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    shoppers = [threading.Thread(target=shopper, args=(n, make_transport(), recorder, deadline, max_item_id, users))
+                for n in range(args.shoppers)]
+    start = time.monotonic()
+    try:
+        for thread in shoppers:
+            thread.start()
+        for thread in shoppers:
+            thread.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return summarize(recorder, time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='Database made with bench.seed')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client')
+    parser.add_argument('--shoppers', type=int, default=8, help='Concurrent simulated shoppers')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run for')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes (server mode)')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker (server mode)')
+    parser.add_argument('--save-baseline', metavar='NAME', help='Store the results as a baseline')
+    parser.add_argument('--compare', metavar='NAME', help='Fail if results regressed against a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = run(args)
+    results['config'] = {key: getattr(args, key) for key in ('mode', 'shoppers', 'duration', 'workers', 'threads')}
+    print_report(results)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, args.save_baseline + '.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, args.compare + '.json')) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print('REGRESSION', message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Generate a synthetic database for benchmarks
+
+    python -m bench.seed bench.db --items 10000 --users 1000 --orders 5000 --reviews 50000
+
+Every user is called user<n> and has the password "password".
+"""
+
+import argparse
+import datetime
+import os
+import random
+import uuid
+
+from werkzeug.security import generate_password_hash
+
+import db
+import migrate
+
+PASSWORD = 'password'
+BATCH_SIZE = 5000
+
+WORDS = (
+    'handmade', 'ceramic', 'woven', 'oak', 'walnut', 'linen', 'leather', 'glass', 'copper', 'wool',
+    'mug', 'bowl', 'basket', 'scarf', 'lamp', 'tray', 'candle', 'print', 'vase', 'blanket',
+    'rustic', 'minimal', 'vintage', 'painted', 'carved', 'stitched', 'glazed', 'natural', 'small', 'large',
+)
+
+
+def phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(sql, rows):
+    for batch in batches(rows):
+        with db.transaction() as conn:
+            conn.executemany(sql, batch)
+
+
+def seed(path, items, users, orders, reviews, seed=0):
+    """Create a fresh database at path and fill it with random data."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.configure(path)
+    migrate.upgrade()
+    rng = random.Random(seed)
+
+    # Hashing is deliberately slow, so every user shares one hash
+    password = generate_password_hash(PASSWORD)
+    insert('INSERT INTO Users (username, email, password) VALUES (?, ?, ?)',
+           ((f'user{n}', f'user{n}@example.com', password) for n in range(users)))
+    insert('INSERT INTO Items (name, description, price) VALUES (?, ?, ?)',
+           ((f'{phrase(rng, 3)} {n}', phrase(rng, 12), round(rng.uniform(1, 500), 2)) for n in range(items)))
+
+    start = datetime.datetime(2024, 1, 1)
+    order_ids = []
+    order_rows = []
+    for n in range(orders):
+        order_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        order_ids.append(order_id)
+        order_date = start + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60))
+        order_rows.append((order_id, f'user{rng.randrange(users)}', 'Somewhere', order_date, '12345678'))
+    insert('INSERT INTO Orders (order_id, user_id, shipping_address, order_date, phone) VALUES (?, ?, ?, ?, ?)', order_rows)
+    insert('INSERT OR IGNORE INTO Order_Items (order_id, item_id, qty) VALUES (?, ?, ?)',
+           ((order_id, rng.randrange(1, items + 1), rng.randrange(1, 4))
+            for order_id in order_ids for _ in range(rng.randrange(1, 5))))
+    # Same backfill as migrations/0010_order_summaries.sql
+    with db.transaction() as conn:
+        conn.execute('UPDATE Order_Items SET price = (SELECT price FROM Items WHERE Items.item_id = Order_Items.item_id)')
+        conn.execute('''UPDATE Orders SET
+            item_count = (SELECT COALESCE(SUM(qty), 0) FROM Order_Items oi WHERE oi.order_id = Orders.order_id AND oi.price IS NOT NULL),
+            total = (SELECT COALESCE(SUM(price * qty), 0) FROM Order_Items oi WHERE oi.order_id = Orders.order_id)''')
+
+    insert('INSERT INTO Reviews (item_id, user_id, rating, review) VALUES (?, ?, ?, ?)',
+           ((rng.randrange(1, items + 1), f'user{rng.randrange(users)}', rng.randrange(1, 6), phrase(rng, 8))
+            for _ in range(reviews)))
+    # Same aggregation as migrations/0006_review_stats.sql
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM Review_Stats')
+        conn.execute('''INSERT INTO Review_Stats (item_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+            SELECT item_id, COUNT(*), SUM(rating), SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+            FROM Reviews GROUP BY item_id''')
+    db.get_db(readonly=False).execute('ANALYZE')
+    db.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='Database file to create (overwritten)')
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--reviews', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    seed(args.path, args.items, args.users, args.orders, args.reviews, args.seed)
+    print(f'Wrote {args.path}')
+
+
+if __name__ == '__main__':
+    main()
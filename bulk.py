@@ -0,0 +1,275 @@
+"""
+Bulk catalog import and export
+
+An uploaded CSV or JSON-lines file is copied to a temporary file and
+imported by a single background thread, so imports never compete with each
+other for the write lock. Rows are read one at a time, validated, and
+upserted on item_id (rows without one are added) BATCH_SIZE at a time with
+executemany, each batch in one transaction that also records the job's
+progress in Import_Jobs. Any worker can therefore report on any job.
+
+Exports stream Items, Orders or Reviews in rowid order, EXPORT_BATCH_SIZE
+rows per query, so the whole table is never held in memory.
+"""
+
+import csv
+import datetime
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask.cli import AppGroup
+
+import catalog
+from db import MAX_INTEGER, query, transaction
+
+BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# Row errors kept in a job's report
+MAX_ERRORS = 100
+# Format -> response mimetype
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+# Export name -> (table, columns)
+EXPORTS = {
+    'items': ('Items', ('item_id', 'name', 'description', 'price', 'image')),
+    'orders': ('Orders', ('order_id', 'user_id', 'order_date', 'payment_status', 'item_count', 'total', 'shipping_address', 'phone')),
+    'reviews': ('Reviews', ('item_id', 'user_id', 'rating', 'review')),
+}
+
+UPSERT_SQL = '''INSERT INTO Items (item_id, name, description, price) VALUES (?, ?, ?, ?)
+    ON CONFLICT (item_id) DO UPDATE SET name = excluded.name, description = excluded.description, price = excluded.price'''
+
+log = logging.getLogger(__name__)
+bulk_cli = AppGroup('bulk', help='Import and export the catalog.')
+
+_import_dir = None
+_executor = None
+
+
+def format_for(filename):
+    """Guess the import format from a file name, or return None."""
+    return EXTENSIONS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def read_records(f, fmt):
+    """Yield (line, record) for every row of a binary file; record is None if the line is not a JSON object."""
+    text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        missing = {'name', 'price'} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header is missing {', '.join(sorted(missing))}")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            record = None
+        yield line, record if isinstance(record, dict) else None
+
+
+def parse_item(record):
+    """Return the (item_id, name, description, price) upsert arguments for a record, or raise ValueError."""
+    if record is None:
+        raise ValueError('Not a JSON object')
+    item_id = record.get('item_id')
+    if item_id in (None, ''):
+        item_id = None
+    else:
+        # int() would turn 7.5 into 7 and True into 1
+        if isinstance(item_id, bool) or isinstance(item_id, float) and not item_id.is_integer():
+            raise ValueError(f'Invalid item_id {item_id!r}')
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid item_id {item_id!r}')
+        if not 1 <= item_id <= MAX_INTEGER:
+            raise ValueError(f'Invalid item_id {item_id!r}')
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError('Missing name')
+    try:
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid price {record.get('price')!r}")
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(f'Invalid price {price!r}')
+    description = record.get('description')
+    return item_id, name, None if description is None else str(description), price
+
+
+def _upsert(conn, batch):
+    """Apply a batch and return (inserted, updated)."""
+    ids = [row[0] for row in batch if row[0] is not None]
+    existing = set()
+    if ids:
+        placeholders = ', '.join('?' * len(ids))
+        existing = {row[0] for row in conn.execute(f'SELECT item_id FROM Items WHERE item_id IN ({placeholders})', ids)}
+    updated = 0
+    for item_id, *_ in batch:
+        if item_id is not None:
+            updated += item_id in existing
+            existing.add(item_id)
+    conn.executemany(UPSERT_SQL, batch)
+    return len(batch) - updated, updated
+
+
+def _save_progress(conn, job_id, report, status='running', message=None):
+    finished_at = None if status == 'running' else datetime.datetime.now()
+    conn.execute('UPDATE Import_Jobs SET status = ?, rows_read = ?, inserted = ?, updated = ?, failed = ?, errors = ?, message = ?, finished_at = ? WHERE job_id = ?',
+                 (status, report['rows_read'], report['inserted'], report['updated'], report['failed'], json.dumps(report['errors']), message, finished_at, job_id))
+
+
+def _flush(job_id, batch, report):
+    with catalog.changing() as conn:
+        inserted, updated = _upsert(conn, batch)
+        report['inserted'] += inserted
+        report['updated'] += updated
+        _save_progress(conn, job_id, report)
+
+
+def create_job(filename, fmt):
+    job_id = uuid.uuid4().hex
+    with transaction() as conn:
+        conn.execute('INSERT INTO Import_Jobs (job_id, filename, format, started_at) VALUES (?, ?, ?, ?)', (job_id, filename, fmt, datetime.datetime.now()))
+    return job_id
+
+
+def run_import(job_id, path, fmt):
+    """Import the file at path, recording progress under job_id, and return the final report."""
+    report = {'rows_read': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    status, message = 'done', None
+    try:
+        with open(path, 'rb') as f:
+            batch = []
+            for line, record in read_records(f, fmt):
+                report['rows_read'] += 1
+                try:
+                    batch.append(parse_item(record))
+                except ValueError as e:
+                    report['failed'] += 1
+                    if len(report['errors']) < MAX_ERRORS:
+                        report['errors'].append({'line': line, 'error': str(e)})
+                if len(batch) == BATCH_SIZE:
+                    _flush(job_id, batch, report)
+                    batch = []
+            if batch:
+                _flush(job_id, batch, report)
+    # Batches already committed stay applied
+    except ValueError as e:
+        # Unreadable file, e.g. a bad header or encoding
+        status, message = 'failed', str(e)
+    except Exception as e:
+        log.exception('Import %s failed', job_id)
+        status, message = 'failed', str(e)
+    with transaction() as conn:
+        _save_progress(conn, job_id, report, status, message)
+    return get_job(job_id)
+
+
+def _run_and_remove(job_id, path, fmt):
+    try:
+        run_import(job_id, path, fmt)
+    finally:
+        os.remove(path)
+
+
+def start_import(upload, fmt=None):
+    """Copy an uploaded file aside and import it in the background; return the job id."""
+    fmt = fmt or format_for(upload.filename)
+    if fmt not in FORMATS:
+        raise ValueError(f"Imports must be one of {', '.join(FORMATS)}")
+    fd, path = tempfile.mkstemp(suffix='.' + fmt, dir=_import_dir)
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(upload.stream, f)
+    job_id = create_job(upload.filename, fmt)
+    _executor.submit(_run_and_remove, job_id, path, fmt)
+    return job_id
+
+
+def get_job(job_id):
+    """Return a job's report as a dict, or None if there is no such job."""
+    row = query('SELECT * FROM Import_Jobs WHERE job_id = ?', (job_id,), one=True)
+    if row is None:
+        return None
+    job = dict(row)
+    job['errors'] = json.loads(job['errors'])
+    return job
+
+
+def recent_jobs(limit=10):
+    return query('SELECT job_id, filename, status, rows_read, failed, started_at FROM Import_Jobs ORDER BY started_at DESC LIMIT ?', (limit,))
+
+
+def export(name, fmt='csv'):
+    """Yield chunks of the named table in fmt, reading EXPORT_BATCH_SIZE rows at a time."""
+    table, columns = EXPORTS[name]
+    select = ', '.join(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+    after = 0
+    while True:
+        rows = query(f'SELECT rowid AS position, {select} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?', (after, EXPORT_BATCH_SIZE))
+        if not rows:
+            break
+        after = rows[-1]['position']
+        for row in rows:
+            values = [row[column] for column in columns]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@bulk_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), help='Defaults to the file extension.')
+def import_command(path, fmt):
+    """Upsert the items in a CSV or JSON-lines file."""
+    fmt = fmt or format_for(path)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format')
+    job = run_import(create_job(os.path.basename(path), fmt), path, fmt)
+    click.echo(f"{job['status']}: {job['rows_read']} rows, {job['inserted']} inserted, {job['updated']} updated, {job['failed']} failed")
+    for error in job['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if job['message']:
+        click.echo(job['message'], err=True)
+
+
+@bulk_cli.command('export')
+@click.argument('name', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--output', type=click.File('w'), default='-')
+def export_command(name, fmt, output):
+    """Write a table as CSV or JSON lines."""
+    for chunk in export(name, fmt):
+        output.write(chunk)
+
+
+def init_app(app):
+    """Stage uploads in app.config['IMPORT_DIR'] (the system temporary directory by default)."""
+    global _import_dir, _executor
+    _import_dir = app.config.setdefault('IMPORT_DIR', None)
+    # One thread: imports run one after another, as SQLite has a single writer anyway
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import')
+    app.cli.add_command(bulk_cli)
@@ -0,0 +1,133 @@
+"""
+Shopping carts
+
+Carts live in the database only. A logged-in user's cart is in Cart, keyed
+by username; a guest's cart is in Guest_Carts, keyed by an opaque id kept in
+their session, and is merged into Cart when they log in. Every change is a
+single INSERT ... ON CONFLICT DO UPDATE, so concurrent clicks can't lose
+updates and the session cookie stays small.
+"""
+
+import datetime
+import secrets
+from collections import namedtuple
+
+import click
+from flask.cli import AppGroup
+
+from db import MAX_INTEGER, query, transaction
+
+# Guest carts untouched for this many days are purged
+GUEST_CART_MAX_AGE = 30
+
+# Which table a cart is in, the column holding its key, and the key
+Owner = namedtuple('Owner', 'table column key')
+
+cart_cli = AppGroup('cart', help='Manage shopping carts.')
+
+
+def current_owner(session):
+    """Return the Owner of the session's cart, giving a guest a cart id if needed."""
+    if 'username' in session:
+        return Owner('Cart', 'user_id', session['username'])
+    if 'cart_id' not in session:
+        session['cart_id'] = secrets.token_urlsafe(16)
+    return Owner('Guest_Carts', 'cart_id', session['cart_id'])
+
+
+def parse_quantities(data, minimum=1):
+    """Read a JSON body like {"items": [{"item_id": 1, "qty": 2}]} into {item_id: qty}, with every qty at least minimum."""
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        raise ValueError('Expected {"items": [{"item_id": ..., "qty": ...}]}')
+    quantities = {}
+    for entry in data['items']:
+        if not isinstance(entry, dict):
+            raise ValueError('Each item must be an object')
+        item_id = entry.get('item_id')
+        qty = entry.get('qty', 1)
+        if type(item_id) is not int or type(qty) is not int or qty < minimum:
+            raise ValueError(f'item_id must be an integer and qty an integer of at least {minimum}')
+        if not -MAX_INTEGER - 1 <= item_id <= MAX_INTEGER or qty > MAX_INTEGER:
+            raise ValueError('item_id and qty must fit in a 64-bit integer')
+        quantities[item_id] = qty
+    return quantities
+
+
+def _upsert_sql(owner, replace):
+    # Selecting from Items ignores ids that aren't in the catalog
+    columns = f'{owner.column}, item_id, qty'
+    values = '?, item_id, ?'
+    update = 'qty = excluded.qty' if replace else 'qty = qty + excluded.qty'
+    if owner.table == 'Guest_Carts':
+        columns += ', updated_at'
+        values += ', ?'
+        update += ', updated_at = excluded.updated_at'
+    return (f'INSERT INTO {owner.table} ({columns}) SELECT {values} FROM Items WHERE item_id = ? '
+            f'ON CONFLICT ({owner.column}, item_id) DO UPDATE SET {update}')
+
+
+def _upsert_args(owner, item_id, qty):
+    if owner.table == 'Guest_Carts':
+        return (owner.key, qty, datetime.datetime.now(), item_id)
+    return (owner.key, qty, item_id)
+
+
+def add(owner, quantities):
+    """Add {item_id: qty} to the cart, on top of what is already there."""
+    with transaction() as conn:
+        conn.executemany(_upsert_sql(owner, replace=False),
+                         [_upsert_args(owner, item_id, qty) for item_id, qty in quantities.items() if qty > 0])
+
+
+def update(owner, quantities):
+    """Set the quantity of each item in {item_id: qty}; a quantity of 0 removes the item."""
+    with transaction() as conn:
+        conn.executemany(_upsert_sql(owner, replace=True),
+                         [_upsert_args(owner, item_id, qty) for item_id, qty in quantities.items() if qty > 0])
+        conn.executemany(f'DELETE FROM {owner.table} WHERE {owner.column} = ? AND item_id = ?',
+                         [(owner.key, item_id) for item_id, qty in quantities.items() if qty <= 0])
+
+
+def remove(owner, item_ids):
+    """Remove the given items from the cart."""
+    with transaction() as conn:
+        conn.executemany(f'DELETE FROM {owner.table} WHERE {owner.column} = ? AND item_id = ?',
+                         [(owner.key, item_id) for item_id in item_ids])
+
+
+def items_sql(table, column):
+    return f'SELECT i.item_id, i.name, i.price, c.qty FROM {table} c INNER JOIN Items i ON c.item_id = i.item_id WHERE c.{column} = ?'
+
+
+def items(owner):
+    """Return the cart's rows joined with their catalog item."""
+    return query(items_sql(owner.table, owner.column), (owner.key,))
+
+
+def merge_guest_cart(session):
+    """Move the session's guest cart into the logged-in user's cart."""
+    cart_id = session.pop('cart_id', None)
+    if cart_id is None or 'username' not in session:
+        return
+    with transaction() as conn:
+        conn.execute('INSERT INTO Cart (user_id, item_id, qty) SELECT ?, item_id, qty FROM Guest_Carts WHERE cart_id = ? '
+                     'ON CONFLICT (user_id, item_id) DO UPDATE SET qty = qty + excluded.qty', (session['username'], cart_id))
+        conn.execute('DELETE FROM Guest_Carts WHERE cart_id = ?', (cart_id,))
+
+
+def purge_guest_carts(max_age=GUEST_CART_MAX_AGE):
+    """Delete guest cart rows not touched in max_age days and return how many were deleted."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=max_age)
+    with transaction() as conn:
+        return conn.execute('DELETE FROM Guest_Carts WHERE updated_at < ?', (cutoff,)).rowcount
+
+
+@cart_cli.command('purge-guests')
+@click.option('--days', default=GUEST_CART_MAX_AGE, help='Delete guest carts older than this.')
+def purge_guests_command(days):
+    """Delete abandoned guest carts."""
+    click.echo(f'Deleted {purge_guest_carts(days)} guest cart rows')
+
+
+def init_app(app):
+    app.cli.add_command(cart_cli)
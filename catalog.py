@@ -0,0 +1,180 @@
+"""
+In-process catalog cache
+
+Catalog pages and individual items are cached per worker and tagged with
+the 'catalog' version (see versions.py). Admin writes go through
+changing(), which bumps that version in the same transaction, so every
+worker drops its cached copies once it sees the new version.
+
+Listings use keyset pagination: a page is fetched with
+WHERE (sort key, item_id) > (last row's values) rather than OFFSET, so
+every page costs one index range read however deep it is.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import versions
+from db import MAX_INTEGER, query, transaction
+
+# LRUs for single items and listing pages, entries expire after CACHE_TTL seconds
+ITEM_CACHE_SIZE = 1024
+PAGE_CACHE_SIZE = 256
+CACHE_TTL = 300
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Rows fetched per query when iterating over the whole catalog
+ITER_BATCH_SIZE = 500
+
+# sort name -> (column, descending)
+SORTS = {
+    'id': ('item_id', False),
+    '-id': ('item_id', True),
+    'price': ('price', False),
+    '-price': ('price', True),
+}
+
+
+class CatalogCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._items = OrderedDict()
+        self._pages = OrderedDict()
+
+    def version(self):
+        """Return the catalog version, emptying the caches if it changed."""
+        version = versions.version('catalog')
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._items.clear()
+                    self._pages.clear()
+                    self._version = version
+        return version
+
+    def get(self, store, size, key, load):
+        """Return store[key], calling load() on a miss or once the entry is older than CACHE_TTL."""
+        version = self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = store.get(key)
+            if entry is not None and entry[0] > now:
+                store.move_to_end(key)
+                return entry[1]
+        value = load()
+        with self._lock:
+            # Don't store rows read under a version that has since been replaced
+            if self._version != version:
+                return value
+            store[key] = (now + CACHE_TTL, value)
+            store.move_to_end(key)
+            while len(store) > size:
+                store.popitem(last=False)
+        return value
+
+    def get_item(self, item_id):
+        return self.get(self._items, ITEM_CACHE_SIZE, item_id,
+                        lambda: query('SELECT * FROM Items WHERE item_id = ?', (item_id,), one=True))
+
+    def get_page(self, sort, after, limit):
+        return self.get(self._pages, PAGE_CACHE_SIZE, (sort, after, limit),
+                        lambda: _load_page(sort, after, limit))
+
+
+cache = CatalogCache()
+
+
+def parse_sort(sort):
+    """Return sort if it is a known sort order, else the default."""
+    return sort if sort in SORTS else 'id'
+
+
+def parse_page_size(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE."""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def make_cursor(sort, row):
+    """Encode the position just after row for the given sort."""
+    column, _ = SORTS[sort]
+    if column == 'item_id':
+        return str(row['item_id'])
+    return f"{row[column]!r}:{row['item_id']}"
+
+
+def parse_cursor(sort, cursor):
+    """Decode a cursor into the (sort key, item_id) it points after, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    column, _ = SORTS[sort]
+    try:
+        if column == 'item_id':
+            value, item_id = None, int(cursor)
+        else:
+            value, item_id = cursor.rsplit(':', 1)
+            value, item_id = float(value), int(item_id)
+    except ValueError:
+        return None
+    # SQLite cannot bind a bigger id; no item could be after it anyway
+    if not -MAX_INTEGER - 1 <= item_id <= MAX_INTEGER:
+        return None
+    return (item_id,) if column == 'item_id' else (value, item_id)
+
+
+def page_sql(sort, keyed):
+    """Return the SELECT for a page in sort order, starting after a cursor if keyed."""
+    column, descending = SORTS[sort]
+    keys = ('item_id',) if column == 'item_id' else (column, 'item_id')
+    direction = 'DESC' if descending else 'ASC'
+    sql = 'SELECT * FROM Items'
+    if keyed:
+        placeholders = ', '.join('?' for _ in keys)
+        sql += f" WHERE ({', '.join(keys)}) {'<' if descending else '>'} ({placeholders})"
+    return f"{sql} ORDER BY {', '.join(f'{key} {direction}' for key in keys)} LIMIT ?"
+
+
+def _load_page(sort, after, limit):
+    # Fetch one extra row to know whether there is a next page
+    rows = query(page_sql(sort, after is not None), (*(after or ()), limit + 1))
+    next_cursor = make_cursor(sort, rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_page(sort='id', cursor=None, limit=None):
+    """Return (items, next_cursor) for the page after cursor; next_cursor is None on the last page."""
+    sort = parse_sort(sort)
+    return cache.get_page(sort, parse_cursor(sort, cursor), parse_page_size(limit))
+
+
+def iter_items(sort='id'):
+    """Yield every item in sort order, reading ITER_BATCH_SIZE rows at a time."""
+    sort = parse_sort(sort)
+    after = None
+    while True:
+        rows, next_cursor = _load_page(sort, after, ITER_BATCH_SIZE)
+        yield from rows
+        if next_cursor is None:
+            return
+        after = parse_cursor(sort, next_cursor)
+
+
+def get_item(item_id):
+    """Return one item, or None if it does not exist."""
+    if not -MAX_INTEGER - 1 <= item_id <= MAX_INTEGER:
+        return None
+    return cache.get_item(item_id)
+
+
+@contextmanager
+def changing():
+    """Yield the write connection for a catalog change and bump the catalog version with it."""
+    with transaction() as conn:
+        yield conn
+        versions.bump(conn, 'catalog')
+    versions.invalidate()
@@ -0,0 +1,40 @@
+"""
+Checkout service
+
+An order is placed in one BEGIN IMMEDIATE transaction: the total and item
+count are computed in SQL and stored on the order, the cart is copied into
+Order_Items with INSERT ... SELECT, capturing each item's current price,
+and then cleared. A client-supplied idempotency key maps a repeated
+submission back to the order it already created.
+"""
+
+import datetime
+import uuid
+
+from db import transaction
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+def place_order(user_id, address, phone, idempotency_key=None):
+    """Turn user_id's cart into an order and return (order_id, total)."""
+    with transaction() as conn:
+        if idempotency_key:
+            placed = conn.execute('SELECT order_id, total FROM Checkout_Keys WHERE user_id = ? AND idempotency_key = ?', (user_id, idempotency_key)).fetchone()
+            if placed:
+                return placed['order_id'], placed['total']
+
+        # Items removed from the catalog since they were added are dropped from the order
+        total, item_count = conn.execute('SELECT SUM(i.price * c.qty), SUM(c.qty) FROM Cart c INNER JOIN Items i ON c.item_id = i.item_id WHERE c.user_id = ?', (user_id,)).fetchone()
+        if not total:
+            raise EmptyCartError()
+
+        order_id = uuid.uuid4().hex
+        conn.execute('INSERT INTO Orders (order_id, user_id, shipping_address, phone, order_date, item_count, total) VALUES (?, ?, ?, ?, ?, ?, ?)', (order_id, user_id, address, phone, datetime.datetime.now(), item_count, total))
+        conn.execute('INSERT INTO Order_Items (order_id, item_id, qty, price) SELECT ?, c.item_id, c.qty, i.price FROM Cart c INNER JOIN Items i ON c.item_id = i.item_id WHERE c.user_id = ?', (order_id, user_id))
+        conn.execute('DELETE FROM Cart WHERE user_id = ?', (user_id,))
+        if idempotency_key:
+            conn.execute('INSERT INTO Checkout_Keys (idempotency_key, user_id, order_id, total) VALUES (?, ?, ?, ?)', (idempotency_key, user_id, order_id, total))
+    return order_id, total
@@ -0,0 +1,176 @@
+"""
+SQLite data-access layer
+
+Connections are pooled per thread (and re-opened after a fork, so each
+gunicorn worker gets its own). Every thread holds a read connection and a
+write connection to the same WAL-mode database: readers never block on the
+writer, and writes go through short explicit transactions.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Applied to every new connection
+PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',  # Safe with WAL, avoids an fsync per commit
+    'PRAGMA cache_size = -16000',  # 16 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',  # Map up to 256 MB of the file
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',  # Wait for the write lock instead of failing
+)
+
+# Largest integer SQLite stores; binding a bigger one raises OverflowError
+MAX_INTEGER = 2 ** 63 - 1
+
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Waiting longer than this for the write lock counts as a lock wait.
+# SQLite's busy handler sleeps at least 1 ms, an uncontended BEGIN is far quicker.
+LOCK_WAIT_THRESHOLD = 0.001
+
+# Instrumentation (see metrics.py): called with the text of every statement
+# run, and with the seconds spent in each query() or transaction()
+statement_hooks = []
+timing_hooks = []
+
+_path = os.environ.get('DATABASE', 'db.db')
+_local = threading.local()
+
+
+def configure(path):
+    """Point the pool at another database file."""
+    global _path
+    close_all()
+    _path = path
+
+
+def _trace(sql):
+    for hook in statement_hooks:
+        hook(sql)
+
+
+def _timed(start):
+    elapsed = time.perf_counter() - start
+    for hook in timing_hooks:
+        hook(elapsed)
+
+
+def _connect(readonly):
+    conn = sqlite3.connect(_path, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    if statement_hooks:
+        conn.set_trace_callback(_trace)
+    if not readonly:
+        # Persistent on the file, so setting it from the writer is enough
+        conn.execute('PRAGMA journal_mode = WAL')
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+def _pool():
+    pool = getattr(_local, 'pool', None)
+    # Connections must not be shared across a fork or a change of database
+    if pool is None or pool['pid'] != os.getpid() or pool['path'] != _path:
+        pool = _local.pool = {'pid': os.getpid(), 'path': _path, 'read': None, 'write': None}
+    return pool
+
+
+def get_db(readonly=True):
+    """Return this thread's read or write connection, opening it if needed."""
+    pool = _pool()
+    key = 'read' if readonly else 'write'
+    if pool[key] is None:
+        if not readonly:
+            # Make sure the file is in WAL mode before the reader opens it
+            pool['write'] = _connect(False)
+        else:
+            if pool['write'] is None:
+                pool['write'] = _connect(False)
+            pool['read'] = _connect(True)
+    return pool[key]
+
+
+def query(sql, args=(), one=False):
+    """Run a read-only query and return all rows, or the first row if one=True."""
+    start = time.perf_counter()
+    try:
+        cursor = get_db().execute(sql, args)
+        return cursor.fetchone() if one else cursor.fetchall()
+    finally:
+        _timed(start)
+
+
+@contextmanager
+def transaction():
+    """Yield the write connection inside a BEGIN IMMEDIATE transaction."""
+    conn = get_db(readonly=False)
+    start = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    if time.perf_counter() - start > LOCK_WAIT_THRESHOLD:
+        _local.lock_waits = getattr(_local, 'lock_waits', 0) + 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        _timed(start)
+        raise
+    conn.execute('COMMIT')
+    _timed(start)
+
+
+def execute(sql, args=()):
+    """Run a single write statement in its own transaction and return the cursor."""
+    with transaction() as conn:
+        return conn.execute(sql, args)
+
+
+def take_lock_waits():
+    """Return how many times this thread waited for the write lock since the last call, and reset the count."""
+    waits = getattr(_local, 'lock_waits', 0)
+    _local.lock_waits = 0
+    return waits
+
+
+def close_all():
+    """Close this thread's connections."""
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        return
+    for key in ('read', 'write'):
+        if pool[key] is not None and pool['pid'] == os.getpid():
+            pool[key].close()
+    _local.pool = None
+
+
+def init_app(app):
+    """Use app.config['DATABASE'] and clean up after each request.
+
+    With app.config['DB_LOCK_STATS'] set, each response carries an
+    X-DB-Lock-Waits header counting the request's waits for the write lock.
+    """
+    configure(app.config.setdefault('DATABASE', os.environ.get('DATABASE', _path)))
+    app.config.setdefault('DB_LOCK_STATS', bool(os.environ.get('DB_LOCK_STATS')))
+
+    if app.config['DB_LOCK_STATS']:
+        @app.before_request
+        def reset_lock_waits():
+            take_lock_waits()
+
+        @app.after_request
+        def report_lock_waits(response):
+            response.headers['X-DB-Lock-Waits'] = str(take_lock_waits())
+            return response
+
+    @app.teardown_appcontext
+    def rollback_unfinished(exc):
+        # A view that raised mid-transaction must not leave the write lock held
+        pool = getattr(_local, 'pool', None)
+        if pool and pool['write'] is not None and pool['write'].in_transaction:
+            pool['write'].execute('ROLLBACK')
@@ -0,0 +1,123 @@
+"""
+Product images
+
+An uploaded image is stored as-is under a name derived from its content,
+then resized in a background thread pool into thumbnail and display
+variants, each as JPEG and WebP. Once every variant is written the item's
+image column is set to the content hash, so pages only ever link to
+complete sets. Because the names change whenever the content does, the
+variants are served with a one-year immutable Cache-Control.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import send_from_directory, url_for
+from PIL import Image
+
+import catalog
+
+# Longest side, in pixels, of each variant
+VARIANTS = {'thumb': 200, 'display': 800}
+# File extension -> (Pillow format, save options)
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+ALLOWED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# Bump when VARIANTS or FORMATS change so the new variants get new names
+PIPELINE_VERSION = b'1'
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+log = logging.getLogger(__name__)
+
+_image_dir = None
+_executor = None
+
+
+class ImageError(ValueError):
+    pass
+
+
+def variant_name(key, variant, ext):
+    return f'{key}-{variant}.{ext}'
+
+
+def save_original(upload):
+    """Store an uploaded file under its content hash and return (key, path)."""
+    ext = os.path.splitext(upload.filename or '')[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ImageError(f"Images must be one of {', '.join(ALLOWED_EXTENSIONS)}")
+    data = upload.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception:
+        raise ImageError(f'{upload.filename} is not a valid image')
+    key = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()[:20]
+    path = os.path.join(_image_dir, 'originals', key + ext)
+    if not os.path.exists(path):
+        _write(path, lambda f: f.write(data))
+    return key, path
+
+
+def _write(path, write):
+    # Write to a temporary file first so a half-written image is never served
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def make_variants(key, path):
+    """Write every size and format of the image at path."""
+    with Image.open(path) as original:
+        original.load()
+        for variant, size in VARIANTS.items():
+            image = original.copy()
+            image.thumbnail((size, size))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            for ext, (fmt, options) in FORMATS.items():
+                target = os.path.join(_image_dir, 'variants', variant_name(key, variant, ext))
+                if not os.path.exists(target):
+                    _write(target, lambda f: image.save(f, fmt, **options))
+
+
+def process(item_id, key, path):
+    try:
+        make_variants(key, path)
+        with catalog.changing() as conn:
+            conn.execute('UPDATE Items SET image = ? WHERE item_id = ?', (key, item_id))
+    except Exception:
+        log.exception('Could not process image %s for item %s', path, item_id)
+
+
+def submit(item_id, key, path):
+    """Generate the variants of a saved original in the background, then attach them to item_id."""
+    _executor.submit(process, item_id, key, path)
+
+
+def image_url(key, variant='thumb', ext='jpg'):
+    return url_for('media', filename=variant_name(key, variant, ext))
+
+
+def serve(filename):
+    """Send a variant with headers that let browsers and CDNs keep it forever."""
+    response = send_from_directory(os.path.join(_image_dir, 'variants'), filename, max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Store images under app.config['IMAGE_DIR'] using app.config['IMAGE_WORKERS'] threads."""
+    global _image_dir, _executor
+    _image_dir = app.config.setdefault('IMAGE_DIR', os.path.join(app.static_folder, 'uploads'))
+    _executor = ThreadPoolExecutor(max_workers=app.config.setdefault('IMAGE_WORKERS', 2), thread_name_prefix='images')
+    app.jinja_env.globals['image_url'] = image_url
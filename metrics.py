@@ -0,0 +1,184 @@
+"""
+Request instrumentation
+
+Every request's time is split into database time (with the number of
+statements run, seen through the connections' trace callback), template
+rendering time and time spent calling external services such as the
+payment provider. Totals are kept per route and served in the Prometheus
+text format at /metrics; each response also carries a Server-Timing header
+so the split shows up in the browser's dev tools.
+
+Counters live in the worker process, so with several gunicorn workers each
+scrape sees one worker (labelled by pid).
+
+Routes listed in PROFILE_ROUTES are run under cProfile for a PROFILE_SAMPLE_RATE
+fraction of requests, with the stats dumped to PROFILE_DIR.
+"""
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+import db
+
+# Upper bounds of the request duration histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Distinct statements tracked in app_db_statements_total
+MAX_STATEMENTS = 500
+
+_lock = threading.Lock()
+_requests = defaultdict(int)  # (route, status) -> count
+_durations = defaultdict(lambda: [0] * (len(BUCKETS) + 1))  # route -> histogram counts
+_totals = defaultdict(lambda: defaultdict(float))  # route -> {'request', 'db', 'queries', 'template'} -> total
+_external = defaultdict(float)  # (route, service) -> seconds
+_statements = defaultdict(int)  # normalized sql -> count
+
+
+def normalize(sql):
+    """Strip comments and literal values from a statement so it can be used as a label."""
+    sql = re.sub(r'--[^\n]*', '', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return ' '.join(sql.split())
+
+
+def _on_statement(sql):
+    # Statements starting with a comment are run internally by triggers and FTS5
+    if not has_request_context() or sql.startswith('--'):
+        return
+    g.metrics['queries'] += 1
+    sql = normalize(sql)
+    with _lock:
+        if sql in _statements or len(_statements) < MAX_STATEMENTS:
+            _statements[sql] += 1
+
+
+def _on_db_time(seconds):
+    if has_request_context():
+        g.metrics['db'] += seconds
+
+
+def _before_render(sender, template, context, **extra):
+    g.metrics_render_start = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    start = g.pop('metrics_render_start', None)
+    if start is not None:
+        g.metrics['template'] += time.perf_counter() - start
+
+
+@contextmanager
+def external(service):
+    """Count the time spent in the block as a call to an external service."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            g.metrics_external[service] += time.perf_counter() - start
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    worker = f'worker="{os.getpid()}"'
+    lines = []
+    with _lock:
+        lines.append('# TYPE app_requests_total counter')
+        for (route, status), count in sorted(_requests.items()):
+            lines.append(f'app_requests_total{{{worker},route="{_label(route)}",status="{status}"}} {count}')
+
+        lines.append('# TYPE app_request_duration_seconds histogram')
+        for route, counts in sorted(_durations.items()):
+            labels = f'{worker},route="{_label(route)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'app_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'app_request_duration_seconds_sum{{{labels}}} {_totals[route]["request"]}')
+            lines.append(f'app_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        for name, key, kind in (('app_db_seconds_total', 'db', 'counter'),
+                                ('app_db_queries_total', 'queries', 'counter'),
+                                ('app_template_seconds_total', 'template', 'counter')):
+            lines.append(f'# TYPE {name} {kind}')
+            for route, totals in sorted(_totals.items()):
+                lines.append(f'{name}{{{worker},route="{_label(route)}"}} {totals[key]}')
+
+        lines.append('# TYPE app_external_seconds_total counter')
+        for (route, service), seconds in sorted(_external.items()):
+            lines.append(f'app_external_seconds_total{{{worker},route="{_label(route)}",service="{_label(service)}"}} {seconds}')
+
+        lines.append('# TYPE app_db_statements_total counter')
+        for sql, count in sorted(_statements.items()):
+            lines.append(f'app_db_statements_total{{{worker},statement="{_label(sql)}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """Instrument app. Call before anything opens a database connection."""
+    app.config.setdefault('SERVER_TIMING', os.environ.get('SERVER_TIMING', '1') == '1')
+    app.config.setdefault('PROFILE_ROUTES', [route for route in os.environ.get('PROFILE_ROUTES', '').split(',') if route])
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', '0.01')))
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', 'profiles'))
+
+    db.statement_hooks.append(_on_statement)
+    db.timing_hooks.append(_on_db_time)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_timing():
+        g.metrics = defaultdict(float)
+        g.metrics_external = defaultdict(float)
+        g.metrics_start = time.perf_counter()
+        if request.endpoint in app.config['PROFILE_ROUTES'] and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record(response):
+        if 'metrics_start' not in g:
+            return response
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], f'{request.endpoint}-{time.time():.6f}-{os.getpid()}.prof'))
+
+        elapsed = time.perf_counter() - g.metrics_start
+        timings = g.metrics
+        route = _route()
+        with _lock:
+            _requests[route, response.status_code] += 1
+            bucket = next((i for i, bound in enumerate(BUCKETS) if elapsed <= bound), len(BUCKETS))
+            _durations[route][bucket] += 1
+            totals = _totals[route]
+            totals['request'] += elapsed
+            for key in ('db', 'queries', 'template'):
+                totals[key] += timings[key]
+            for service, seconds in g.metrics_external.items():
+                _external[route, service] += seconds
+
+        if app.config['SERVER_TIMING']:
+            parts = [f'db;dur={timings["db"] * 1000:.2f};desc="{int(timings["queries"])} queries"',
+                     f'tpl;dur={timings["template"] * 1000:.2f}']
+            parts += [f'{service};dur={seconds * 1000:.2f}' for service, seconds in g.metrics_external.items()]
+            parts.append(f'total;dur={elapsed * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(parts)
+        return response
@@ -0,0 +1,131 @@
+"""
+Schema migrations
+
+Migrations are the numbered .sql files in migrations/, applied in order.
+The schema_version table records which have run; each migration runs in its
+own transaction together with its schema_version row, so concurrent workers
+starting up at once apply it exactly once.
+"""
+
+import datetime
+import os
+import re
+import sqlite3
+
+import click
+from flask.cli import AppGroup
+
+import cart
+import catalog
+import orders
+import reviews
+from db import get_db, transaction
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Queries run on every page view of their route; none may scan a whole table.
+# The paginated ones come from the modules that run them so they cannot drift.
+HOT_QUERIES = (
+    ('product', 'SELECT * FROM Items WHERE item_id = ?'),
+    ('product reviews', reviews.FIRST_PAGE_SQL),
+    ('product reviews page', reviews.PAGE_SQL),
+    ('review stats', 'SELECT * FROM Review_Stats WHERE item_id = ?'),
+    *((f'catalog by {sort}', catalog.page_sql(sort, keyed=False)) for sort in catalog.SORTS),
+    *((f'catalog page by {sort}', catalog.page_sql(sort, keyed=True)) for sort in catalog.SORTS),
+    ('view_orders', orders.FIRST_PAGE_SQL),
+    ('view_orders page', orders.PAGE_SQL),
+    ('order', orders.ORDER_SQL),
+    ('order lines', orders.LINES_SQL),
+    ('review', 'SELECT DISTINCT i.name, i.item_id FROM Order_Items oi INNER JOIN Items i ON oi.item_id = i.item_id INNER JOIN Orders o ON o.order_id = oi.order_id WHERE o.user_id = ?'),
+    ('cart', cart.items_sql('Cart', 'user_id')),
+    ('guest cart', cart.items_sql('Guest_Carts', 'cart_id')),
+    ('orders containing item', 'SELECT order_id, qty FROM Order_Items WHERE item_id = ?'),
+    ('login', 'SELECT * FROM Users WHERE username = ?'),
+)
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+
+def available():
+    """Return [(version, name, path)] for every migration file, in order."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r'(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def statements(script):
+    """Split an SQL script into complete statements (trigger bodies included)."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+    if statement.strip():
+        yield statement.strip()
+
+
+def current_version():
+    conn = get_db(readonly=False)
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def upgrade():
+    """Apply every pending migration and return the names of those applied."""
+    current_version()
+    applied = []
+    for version, name, path in available():
+        with open(path) as f:
+            script = f.read()
+        with transaction() as conn:
+            # Another worker may have applied it since we last looked
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                continue
+            for statement in statements(script):
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)', (version, name, datetime.datetime.now()))
+        applied.append(f'{version:04d}_{name}')
+    return applied
+
+
+def full_scans():
+    """Return [(name, plan detail)] for every hot query whose plan scans a whole table."""
+    conn = get_db()
+    scans = []
+    for name, sql in HOT_QUERIES:
+        plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * sql.count('?'))]
+        # A scan already in ORDER BY order stops after LIMIT rows
+        ordered = ' LIMIT ' in sql and not any('TEMP B-TREE' in detail for detail in plan)
+        for detail in plan:
+            if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail and not ordered:
+                scans.append((name, detail))
+    return scans
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending migrations."""
+    applied = upgrade()
+    for name in applied:
+        click.echo(f'Applied {name}')
+    click.echo(f'Schema at version {current_version()}')
+
+
+@db_cli.command('check-plans')
+def check_plans_command():
+    """Fail if a hot query falls back to a full table scan."""
+    scans = full_scans()
+    for name, detail in scans:
+        click.echo(f'{name}: {detail}', err=True)
+    if scans:
+        raise SystemExit(1)
+    click.echo(f'All {len(HOT_QUERIES)} hot queries use an index')
+
+
+def init_app(app):
+    upgrade()
+    app.cli.add_command(db_cli)
@@ -0,0 +1,51 @@
+-- Schema of the original db.db
+CREATE TABLE IF NOT EXISTS Users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Items (
+    item_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    price REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Admins (
+    admin_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "Cart" (
+	"user_id"	INTEGER,
+	"item_id"	INTEGER,
+	"qty"	INTEGER NOT NULL,
+	PRIMARY KEY("user_id","item_id"),
+	FOREIGN KEY("user_id") REFERENCES "Users"("user_id"),
+	FOREIGN KEY("item_id") REFERENCES "Items"("item_id")
+);
+CREATE TABLE IF NOT EXISTS "Orders" (
+	"order_id"	TEXT,
+	"user_id"	TEXT,
+	"shipping_address"	TEXT NOT NULL,
+	"payment_status"	INTEGER DEFAULT 0,
+	"order_date"	TEXT NOT NULL,
+	"phone"	TEXT,
+	FOREIGN KEY("user_id") REFERENCES "Users"("user_id"),
+	PRIMARY KEY("order_id")
+);
+CREATE TABLE IF NOT EXISTS "Order_Items" (
+	"order_id"	INTEGER,
+	"item_id"	INTEGER,
+	"qty"	INTEGER NOT NULL,
+	FOREIGN KEY("order_id") REFERENCES "Orders"("order_id"),
+	FOREIGN KEY("item_id") REFERENCES "Items"("item_id"),
+	PRIMARY KEY("order_id","item_id")
+);
+CREATE TABLE IF NOT EXISTS "Reviews" (
+	"item_id"	INTEGER,
+	"user_id"	INTEGER,
+	"rating"	INTEGER,
+	"review"	TEXT
+);
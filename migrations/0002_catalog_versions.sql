@@ -0,0 +1,5 @@
+-- Catalog version used to invalidate the in-process caches (catalog.py)
+CREATE TABLE IF NOT EXISTS Versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);
+INSERT OR IGNORE INTO Versions (name, version) VALUES ('catalog', 0);
+-- Keyset pagination by price
+CREATE INDEX IF NOT EXISTS Items_price ON Items (price, item_id);
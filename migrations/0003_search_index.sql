@@ -0,0 +1,17 @@
+-- Full-text index over Items (search_index.py), kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS Items_fts USING fts5(
+    name, description,
+    content='Items', content_rowid='item_id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS Items_fts_insert AFTER INSERT ON Items BEGIN
+    INSERT INTO Items_fts (rowid, name, description) VALUES (new.item_id, new.name, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS Items_fts_delete AFTER DELETE ON Items BEGIN
+    INSERT INTO Items_fts (Items_fts, rowid, name, description) VALUES ('delete', old.item_id, old.name, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS Items_fts_update AFTER UPDATE ON Items BEGIN
+    INSERT INTO Items_fts (Items_fts, rowid, name, description) VALUES ('delete', old.item_id, old.name, old.description);
+    INSERT INTO Items_fts (rowid, name, description) VALUES (new.item_id, new.name, new.description);
+END;
+INSERT INTO Items_fts (Items_fts) VALUES ('rebuild');
@@ -0,0 +1,8 @@
+-- Idempotency keys for checkout (checkout.py)
+CREATE TABLE IF NOT EXISTS Checkout_Keys (
+    idempotency_key TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
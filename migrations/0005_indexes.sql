@@ -0,0 +1,22 @@
+-- Order ids are uuid hex strings, but Order_Items declared them INTEGER,
+-- so an all-digit id would have been stored as a number
+CREATE TABLE Order_Items_new (
+	"order_id"	TEXT,
+	"item_id"	INTEGER,
+	"qty"	INTEGER NOT NULL,
+	FOREIGN KEY("order_id") REFERENCES "Orders"("order_id"),
+	FOREIGN KEY("item_id") REFERENCES "Items"("item_id"),
+	PRIMARY KEY("order_id","item_id")
+);
+INSERT INTO Order_Items_new (order_id, item_id, qty) SELECT CAST(order_id AS TEXT), item_id, qty FROM Order_Items;
+DROP TABLE Order_Items;
+ALTER TABLE Order_Items_new RENAME TO Order_Items;
+
+-- view_orders and review look orders up by customer, newest first
+CREATE INDEX IF NOT EXISTS Orders_user_date ON Orders (user_id, order_date);
+-- Product pages list an item's reviews
+CREATE INDEX IF NOT EXISTS Reviews_item ON Reviews (item_id);
+-- Covers lookups of the orders containing an item
+CREATE INDEX IF NOT EXISTS Order_Items_item ON Order_Items (item_id, order_id, qty);
+-- Login looks users up by name
+CREATE INDEX IF NOT EXISTS Users_username ON Users (username);
@@ -0,0 +1,16 @@
+-- Per-item review aggregates, maintained by reviews.add_review()
+CREATE TABLE IF NOT EXISTS Review_Stats (
+    item_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0,
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR REPLACE INTO Review_Stats (item_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+SELECT item_id, COUNT(*), SUM(rating),
+    SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+FROM Reviews
+GROUP BY item_id;
@@ -0,0 +1,10 @@
+-- Carts of visitors who are not logged in, keyed by an opaque id kept in their session (cart.py)
+CREATE TABLE IF NOT EXISTS Guest_Carts (
+    cart_id TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    qty INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (cart_id, item_id),
+    FOREIGN KEY (item_id) REFERENCES Items (item_id)
+);
+CREATE INDEX IF NOT EXISTS Guest_Carts_updated ON Guest_Carts (updated_at);
@@ -0,0 +1,2 @@
+-- Content hash naming the item's processed image variants (images.py), NULL if it has none
+ALTER TABLE Items ADD COLUMN image TEXT;
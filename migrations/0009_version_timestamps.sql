@@ -0,0 +1,5 @@
+-- When each version last changed, for Last-Modified headers (pagecache.py)
+ALTER TABLE Versions ADD COLUMN updated_at TEXT;
+UPDATE Versions SET updated_at = strftime('%Y-%m-%dT%H:%M:%SZ', 'now');
+-- Bumped with every new review
+INSERT OR IGNORE INTO Versions (name, version, updated_at) VALUES ('reviews', 0, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'));
@@ -0,0 +1,14 @@
+-- Order summaries and the price paid for each line, written by checkout.place_order()
+ALTER TABLE Orders ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Orders ADD COLUMN total REAL NOT NULL DEFAULT 0;
+ALTER TABLE Order_Items ADD COLUMN price REAL;
+
+-- Earlier orders only have today's prices to go by
+UPDATE Order_Items SET price = (SELECT price FROM Items WHERE Items.item_id = Order_Items.item_id);
+UPDATE Orders SET
+    item_count = (SELECT COALESCE(SUM(qty), 0) FROM Order_Items oi WHERE oi.order_id = Orders.order_id AND oi.price IS NOT NULL),
+    total = (SELECT COALESCE(SUM(price * qty), 0) FROM Order_Items oi WHERE oi.order_id = Orders.order_id);
+
+-- Covers order history pages, newest first, keyed on (order_date, order_id)
+DROP INDEX IF EXISTS Orders_user_date;
+CREATE INDEX IF NOT EXISTS Orders_history ON Orders (user_id, order_date, order_id, payment_status, item_count, total);
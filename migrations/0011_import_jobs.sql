@@ -0,0 +1,16 @@
+-- Progress and results of bulk catalog imports (bulk.py), shared by all workers
+CREATE TABLE IF NOT EXISTS Import_Jobs (
+    job_id TEXT PRIMARY KEY,
+    filename TEXT,
+    format TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    rows_read INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    errors TEXT NOT NULL DEFAULT '[]',
+    message TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS Import_Jobs_started ON Import_Jobs (started_at);
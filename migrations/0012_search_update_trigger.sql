@@ -0,0 +1,6 @@
+-- Only re-index an item when a searched column changes, not on every price or image edit
+DROP TRIGGER IF EXISTS Items_fts_update;
+CREATE TRIGGER Items_fts_update AFTER UPDATE OF item_id, name, description ON Items BEGIN
+    INSERT INTO Items_fts (Items_fts, rowid, name, description) VALUES ('delete', old.item_id, old.name, old.description);
+    INSERT INTO Items_fts (rowid, name, description) VALUES (new.item_id, new.name, new.description);
+END;
@@ -0,0 +1,55 @@
+"""
+Order history
+
+Each order stores its item count and total, and each line the price paid,
+as written by checkout.place_order(), so history never joins the current
+catalog for prices. Pages are keyset-paginated on (order_date, order_id),
+newest first, and read straight from the Orders_history index.
+"""
+
+from db import query
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+SUMMARY_COLUMNS = 'order_id, order_date, payment_status, item_count, total'
+FIRST_PAGE_SQL = f'SELECT {SUMMARY_COLUMNS} FROM Orders WHERE user_id = ? ORDER BY order_date DESC, order_id DESC LIMIT ?'
+PAGE_SQL = f'SELECT {SUMMARY_COLUMNS} FROM Orders WHERE user_id = ? AND (order_date, order_id) < (?, ?) ORDER BY order_date DESC, order_id DESC LIMIT ?'
+ORDER_SQL = f'SELECT {SUMMARY_COLUMNS} FROM Orders WHERE order_id = ? AND user_id = ?'
+LINES_SQL = 'SELECT oi.item_id, i.name, oi.price, oi.qty FROM Order_Items oi LEFT JOIN Items i ON oi.item_id = i.item_id WHERE oi.order_id = ?'
+
+
+def make_cursor(row):
+    """Encode the position just after row."""
+    return f"{row['order_date']}:{row['order_id']}"
+
+
+def parse_cursor(cursor):
+    """Decode a cursor into (order_date, order_id), or None if it is missing or malformed."""
+    if not cursor or ':' not in cursor:
+        return None
+    # Dates contain colons, order ids do not
+    order_date, order_id = cursor.rsplit(':', 1)
+    return order_date, order_id
+
+
+def get_page(user_id, before=None, limit=None):
+    """Return (orders, next_before) for user_id's orders placed before the cursor; next_before is None on the last page."""
+    limit = min(max(limit or PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    position = parse_cursor(before)
+    if position is None:
+        rows = query(FIRST_PAGE_SQL, (user_id, limit + 1))
+    else:
+        rows = query(PAGE_SQL, (user_id, *position, limit + 1))
+    next_before = make_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+def get_order(user_id, order_id):
+    """Return (order, lines) for one of user_id's orders, or None if they have no such order."""
+    order = query(ORDER_SQL, (order_id, user_id), one=True)
+    if order is None:
+        return None
+    # Items deleted from the catalog since keep their line, without a name
+    lines = query(LINES_SQL, (order_id,))
+    return order, lines
@@ -0,0 +1,109 @@
+"""
+Conditional GET and rendered fragments
+
+Public pages are tagged with the versions of the data they show (see
+versions.py): the ETag is a hash of those versions, the URL, whether the
+visitor is logged in (the only per-user part of base.html) and the
+templates, and Last-Modified is the time of the latest change. A request
+whose If-None-Match still matches gets a 304 before the view runs, so
+revalidations cost one cached version lookup. If-Modified-Since alone is
+not trusted, as a date cannot tell a guest's page from a logged-in one.
+
+Pieces of a page that are the same for every visitor, such as catalog rows
+and product details, are rendered once per data version and kept in an LRU
+with fragment().
+"""
+
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, g, make_response, request, session
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+
+import versions
+
+# Rendered fragments kept per worker
+FRAGMENT_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+_fragments = OrderedDict()
+_salt = ''
+
+
+def _versions(names):
+    # Versions as of the start of the request, so data loaded by the view is never older than its tag
+    snapshot = g.setdefault('page_versions', {})
+    for name in names:
+        if name not in snapshot:
+            snapshot[name] = versions.version(name)
+    return tuple(snapshot[name] for name in names)
+
+
+def etag(names):
+    parts = [str(version) for version in _versions(names)]
+    parts += [request.full_path, 'user' if 'username' in session else 'guest', _salt]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+
+def conditional(*names):
+    """Answer conditional GETs for a view whose output only changes with the named versions."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages are shown once, so the page must be rendered
+            if '_flashes' in session:
+                return view(*args, **kwargs)
+            tag = etag(names)
+            modified = versions.last_modified(*names)
+            # Only the ETag covers login state and templates, so If-Modified-Since never gives a 304
+            if not is_resource_modified(request.environ, etag=tag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.last_modified = modified
+            # Caches may store the page but must revalidate it every time
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment(template, key, depends=('catalog',), **context):
+    """Render template with context once per version of depends and key."""
+    cache_key = (template, key, _versions(depends))
+    with _lock:
+        html = _fragments.get(cache_key)
+        if html is not None:
+            _fragments.move_to_end(cache_key)
+            return html
+    # Rendered without Flask's signals so the time counts towards the enclosing template
+    html = Markup(current_app.jinja_env.get_template(template).render(context))
+    with _lock:
+        _fragments[cache_key] = html
+        if len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return html
+
+
+def _template_digest(app):
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()
+
+
+def init_app(app):
+    global _salt
+    # Templates are part of the ETag so a deploy that changes them invalidates cached pages
+    _salt = _template_digest(app)
+    app.jinja_env.globals['fragment'] = fragment
@@ -0,0 +1,212 @@
+"""
+Password hashing and login throttling
+
+Hashes are computed and checked on a small thread pool (hashlib releases
+the GIL while it works), so a burst of logins uses at most
+PASSWORD_HASH_WORKERS cores instead of stalling every request thread. When
+more than PASSWORD_HASH_QUEUE checks are already waiting, new ones fail
+fast with Busy (503).
+
+Basic auth sends the password with every request, so a successful check is
+remembered for AUTH_CACHE_TTL seconds under an HMAC of the credentials
+with a per-process random key; nothing stored could be used to recover
+the password.
+
+Failed attempts are counted per client IP and per username over
+LOGIN_FAILURE_WINDOW seconds. Past the limits further attempts are refused
+with Throttled (429) before any hashing is done. For Basic auth the
+per-user count is kept per (username, IP), so failures from elsewhere
+cannot lock the admin out. Counts and the cache live in each worker
+process.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+# Successful Basic auth checks remembered
+AUTH_CACHE_SIZE = 1024
+# Usernames and IPs whose failures are tracked
+MAX_TRACKED = 10000
+
+_config = {}
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_cache_key = secrets.token_bytes(32)
+_verified = OrderedDict()  # digest -> (username, expires)
+
+
+class Busy(Exception):
+    pass
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many failed attempts; retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+def _run(fn, *args):
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_config.get('workers', 2), thread_name_prefix='passwords')
+            _slots = threading.BoundedSemaphore(_config.get('workers', 2) + _config.get('queue', 32))
+    if not _slots.acquire(blocking=False):
+        raise Busy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    """Hash password with the configured method on the hashing pool."""
+    return _run(generate_password_hash, password, _config.get('method', DEFAULT_METHOD))
+
+
+def check_password(hashed, password):
+    """Check password against hashed on the hashing pool."""
+    return _run(check_password_hash, hashed, password)
+
+
+def _method_prefix():
+    # Werkzeug fills in default costs for short forms like 'scrypt', so compare with a real hash
+    prefix = _config.get('prefix')
+    if prefix is None:
+        prefix = _config['prefix'] = hash_password('').split('$', 1)[0]
+    return prefix
+
+
+def needs_rehash(hashed):
+    """Whether hashed was made with a different method or cost than the configured one."""
+    return hashed.split('$', 1)[0] != _method_prefix()
+
+
+class Throttle:
+    """Sliding-window count of failures per key."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()  # key -> deque of failure times
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        if times is None:
+            return None
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        return times
+
+    def retry_after(self, key):
+        """Seconds until key may try again, or 0 if it is under the limit."""
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent(key, now)
+            if not times or len(times) < self.limit:
+                return 0
+            return max(1, int(times[-self.limit] + self.window - now) + 1)
+
+    def fail(self, key):
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent(key, now)
+            if times is None:
+                times = self._failures[key] = deque(maxlen=self.limit)
+            times.append(now)
+            self._failures.move_to_end(key)
+            if len(self._failures) > MAX_TRACKED:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+user_throttle = Throttle(5, 300)
+ip_throttle = Throttle(20, 300)
+
+
+def check_throttle(user_key, remote_addr):
+    """Raise Throttled if the user or the address has failed too often."""
+    retry_after = max(user_throttle.retry_after(user_key), ip_throttle.retry_after(remote_addr))
+    if retry_after:
+        raise Throttled(retry_after)
+
+
+def record_attempt(user_key, remote_addr, success):
+    if success:
+        # Not the address: one valid account must not unlock a stuffing run
+        user_throttle.reset(user_key)
+    else:
+        user_throttle.fail(user_key)
+        ip_throttle.fail(remote_addr)
+
+
+def login(username, password, hashed, remote_addr, user_key=None):
+    """Check a login attempt against hashed (None if there is no such user), throttled per user_key (default the username) and per address."""
+    user_key = username if user_key is None else user_key
+    check_throttle(user_key, remote_addr)
+    ok = hashed is not None and check_password(hashed, password)
+    record_attempt(user_key, remote_addr, ok)
+    return ok
+
+
+def verify_basic(username, password, hashed, remote_addr):
+    """Check Basic auth credentials, answering from the cache of recent successes when possible."""
+    if not username:
+        # Browsers first ask without credentials; that is not a failed attempt
+        return False
+    digest = hmac.new(_cache_key, f'{username}\0{password}'.encode(), hashlib.sha256).digest()
+    now = time.monotonic()
+    with _lock:
+        cached = _verified.get(digest)
+        if cached and cached[1] > now and hashed is not None:
+            return True
+    # Per address too, or anyone could lock the admin out of every admin page
+    if not login(username, password, hashed, remote_addr, user_key=(username, remote_addr)):
+        return False
+    with _lock:
+        _verified[digest] = (username, now + _config.get('auth_cache_ttl', 60))
+        _verified.move_to_end(digest)
+        if len(_verified) > AUTH_CACHE_SIZE:
+            _verified.popitem(last=False)
+    return True
+
+
+def init_app(app):
+    """Configure hashing cost, the pool and the limits from app.config (or the environment)."""
+    global _executor
+    env = os.environ.get
+    _config.pop('prefix', None)
+    _config.update(
+        method=app.config.setdefault('PASSWORD_HASH_METHOD', env('PASSWORD_HASH_METHOD', DEFAULT_METHOD)),
+        workers=app.config.setdefault('PASSWORD_HASH_WORKERS', int(env('PASSWORD_HASH_WORKERS', '2'))),
+        queue=app.config.setdefault('PASSWORD_HASH_QUEUE', int(env('PASSWORD_HASH_QUEUE', '32'))),
+        auth_cache_ttl=app.config.setdefault('AUTH_CACHE_TTL', float(env('AUTH_CACHE_TTL', '60'))),
+    )
+    window = app.config.setdefault('LOGIN_FAILURE_WINDOW', float(env('LOGIN_FAILURE_WINDOW', '300')))
+    user_throttle.limit = app.config.setdefault('LOGIN_MAX_FAILURES', int(env('LOGIN_MAX_FAILURES', '5')))
+    ip_throttle.limit = app.config.setdefault('LOGIN_MAX_FAILURES_PER_IP', int(env('LOGIN_MAX_FAILURES_PER_IP', '20')))
+    user_throttle.window = ip_throttle.window = window
+    # Recreated with the new sizes on first use
+    _executor = None
+
+    @app.errorhandler(Busy)
+    def busy(e):
+        return 'Too many logins in progress, try again shortly', 503, {'Retry-After': '1'}
+
+    @app.errorhandler(Throttled)
+    def throttled(e):
+        return str(e), 429, {'Retry-After': str(e.retry_after)}
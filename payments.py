@@ -0,0 +1,80 @@
+"""
+Payment gateways
+
+Checkout only talks to the PaymentGateway interface. The gateway is called
+after the order transaction has committed, so a slow provider never holds
+the database write lock; the Stripe gateway also caps how long a request
+may wait on the network. The call is still made on the request thread, so
+a slow provider ties up a worker thread for up to PAYMENT_TIMEOUT seconds.
+"""
+
+import os
+
+import stripe
+
+# Seconds to wait on the payment provider before giving up
+PAYMENT_TIMEOUT = 10
+
+
+class PaymentError(Exception):
+    pass
+
+
+class PaymentGateway:
+    def create_session(self, order_id, total, success_url, cancel_url):
+        """Start a payment for order_id and return the URL to send the customer to."""
+        raise NotImplementedError
+
+
+class StripeGateway(PaymentGateway):
+    def __init__(self, api_key, timeout=PAYMENT_TIMEOUT):
+        # A client of our own, so the timeout does not leak into other users of the stripe module
+        self.client = stripe.StripeClient(api_key, http_client=stripe.new_default_http_client(timeout=timeout)) if api_key else None
+
+    def create_session(self, order_id, total, success_url, cancel_url):
+        if self.client is None:
+            raise PaymentError('Stripe API key not set')
+        try:
+            checkout_session = self.client.v1.checkout.sessions.create({
+                'line_items': [
+                    {
+                        'price_data': {
+                            'currency': 'sgd',
+                            'product': 'prod_Pb3YILaur4mxxM',
+                            'unit_amount': int(round(total * 100)),
+                        },
+                        'quantity': 1,
+                    },
+                ],
+                'mode': 'payment',
+                'success_url': success_url,
+                'cancel_url': cancel_url,
+            }, options={
+                # A resubmitted order gets the same Stripe session back
+                'idempotency_key': order_id,
+            })
+        except stripe.StripeError as e:
+            raise PaymentError(str(e)) from e
+        return checkout_session.url
+
+
+class FakeGateway(PaymentGateway):
+    """Accepts every payment without a network call. For tests and local development."""
+
+    def __init__(self):
+        self.sessions = []
+
+    def create_session(self, order_id, total, success_url, cancel_url):
+        self.sessions.append({'order_id': order_id, 'total': total})
+        return success_url
+
+
+def init_app(app):
+    """Choose the gateway from app.config['PAYMENT_GATEWAY'] ('stripe' or 'fake')."""
+    name = app.config.setdefault('PAYMENT_GATEWAY', os.environ.get('PAYMENT_GATEWAY', 'stripe'))
+    if name == 'fake':
+        gateway = FakeGateway()
+    else:
+        gateway = StripeGateway(os.environ.get('STRIPE_SECRET_KEY'))
+    app.extensions['payment_gateway'] = gateway
+    return gateway
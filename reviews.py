@@ -0,0 +1,70 @@
+"""
+Product reviews
+
+Review_Stats holds a running count, rating sum and rating histogram per
+item, updated in the same transaction as each new review, so showing an
+item's rating never reads its reviews. Reviews themselves are listed newest
+first, one keyset page at a time.
+"""
+
+import versions
+from db import MAX_INTEGER, query, transaction
+
+PAGE_SIZE = 10
+
+FIRST_PAGE_SQL = 'SELECT rowid AS review_id, rating, review FROM Reviews WHERE item_id = ? ORDER BY rowid DESC LIMIT ?'
+PAGE_SQL = 'SELECT rowid AS review_id, rating, review FROM Reviews WHERE item_id = ? AND rowid < ? ORDER BY rowid DESC LIMIT ?'
+
+
+def add_review(item_id, user_id, rating, review):
+    """Store a review and fold it into the item's aggregates."""
+    if rating not in range(1, 6):
+        raise ValueError('Rating must be between 1 and 5')
+    with transaction() as conn:
+        conn.execute('INSERT INTO Reviews (item_id, user_id, rating, review) VALUES (?, ?, ?, ?)', (item_id, user_id, rating, review))
+        conn.execute(
+            f'INSERT INTO Review_Stats (item_id, review_count, rating_sum, rating_{rating}) VALUES (?, 1, ?, 1) '
+            'ON CONFLICT (item_id) DO UPDATE SET review_count = review_count + 1, rating_sum = rating_sum + excluded.rating_sum, '
+            f'rating_{rating} = rating_{rating} + 1',
+            (item_id, rating),
+        )
+        versions.bump(conn, 'reviews')
+    versions.invalidate()
+
+
+def summarize(row):
+    """Turn a Review_Stats row (or None) into a dict for templates."""
+    if row is None:
+        return {'count': 0, 'average': None, 'histogram': {rating: 0 for rating in range(5, 0, -1)}}
+    return {
+        'count': row['review_count'],
+        'average': row['rating_sum'] / row['review_count'] if row['review_count'] else None,
+        'histogram': {rating: row[f'rating_{rating}'] for rating in range(5, 0, -1)},
+    }
+
+
+def get_stats(item_id):
+    """Return the rating summary for one item."""
+    return summarize(query('SELECT * FROM Review_Stats WHERE item_id = ?', (item_id,), one=True))
+
+
+def get_stats_for(item_ids):
+    """Return {item_id: summary} for several items in one query."""
+    item_ids = list(item_ids)
+    stats = {item_id: summarize(None) for item_id in item_ids}
+    if item_ids:
+        placeholders = ', '.join('?' for _ in item_ids)
+        for row in query(f'SELECT * FROM Review_Stats WHERE item_id IN ({placeholders})', item_ids):
+            stats[row['item_id']] = summarize(row)
+    return stats
+
+
+def get_page(item_id, before=None, limit=PAGE_SIZE):
+    """Return (reviews, next_before) for the reviews older than before; next_before is None on the last page."""
+    # A cursor too big for SQLite is after every review; one too small is before all of them
+    if before is None or before > MAX_INTEGER:
+        rows = query(FIRST_PAGE_SQL, (item_id, limit + 1))
+    else:
+        rows = query(PAGE_SQL, (item_id, max(before, -MAX_INTEGER - 1), limit + 1))
+    next_before = rows[limit - 1]['review_id'] if len(rows) > limit else None
+    return rows[:limit], next_before
@@ -0,0 +1,62 @@
+"""
+Full-text product search
+
+Items_fts is an external-content FTS5 index over Items.name and
+Items.description, kept in sync by triggers (see
+migrations/0003_search_index.sql and 0012_search_update_trigger.sql) so
+every write path (admin routes, scripts, manual SQL) updates it. Results
+are ranked with BM25, names weighing more than descriptions.
+"""
+
+import click
+from flask.cli import AppGroup
+
+from db import query, transaction
+
+PAGE_SIZE = 20
+# Deeper pages are refused: OFFSET reads and ranks every skipped row
+MAX_PAGE = 500
+# BM25 column weights for (name, description)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+search_cli = AppGroup('search', help='Manage the product search index.')
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    terms = []
+    for word in text.split():
+        word = word.replace('"', '""')
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def search(text, page=1, page_size=PAGE_SIZE):
+    """Return (items, has_more) for one page of ranked results."""
+    expression = match_expression(text or '')
+    if not expression:
+        return [], False
+    rows = query(
+        'SELECT i.* FROM Items_fts f INNER JOIN Items i ON i.item_id = f.rowid '
+        'WHERE Items_fts MATCH ? ORDER BY bm25(Items_fts, ?, ?) LIMIT ? OFFSET ?',
+        (expression, NAME_WEIGHT, DESCRIPTION_WEIGHT, page_size + 1, (page - 1) * page_size),
+    )
+    return rows[:page_size], len(rows) > page_size
+
+
+def rebuild():
+    """Re-index every item from the Items table."""
+    with transaction() as conn:
+        conn.execute("INSERT INTO Items_fts (Items_fts) VALUES ('rebuild')")
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the search index from the Items table."""
+    rebuild()
+    click.echo('Search index rebuilt')
+
+
+def init_app(app):
+    app.cli.add_command(search_cli)
@@ -0,0 +1,64 @@
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app is configured when it is imported, so point it at throwaway state first
+os.environ['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'import.db')
+os.environ['PAYMENT_GATEWAY'] = 'fake'
+os.environ['SECRET_KEY'] = 'test'
+# Cheap hashes keep the suite fast
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+
+import app as app_module  # noqa: E402
+import catalog  # noqa: E402
+import db  # noqa: E402
+import images  # noqa: E402
+import migrate  # noqa: E402
+import pagecache  # noqa: E402
+import passwords  # noqa: E402
+import versions  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a freshly migrated database, with every in-process cache emptied."""
+    db.configure(str(tmp_path / 'test.db'))
+    migrate.upgrade()
+    images._image_dir = str(tmp_path / 'uploads')
+    catalog.cache = catalog.CatalogCache()
+    versions.invalidate()
+    pagecache._fragments.clear()
+    passwords._verified.clear()
+    for throttle in (passwords.user_throttle, passwords.ip_throttle):
+        throttle._failures.clear()
+    app_module.app.config['TESTING'] = True
+    app_module.app.extensions['payment_gateway'].sessions.clear()
+    yield app_module.app
+    db.close_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {'Authorization': 'Basic ' + base64.b64encode(b'admin:admin').decode()}
+
+
+def add_item(name='Mug', price=10.0):
+    with catalog.changing() as conn:
+        return conn.execute('INSERT INTO Items (name, description, price) VALUES (?, ?, ?)', (name, name, price)).lastrowid
+
+
+def log_in(client, username='alice', password='secret'):
+    client.post('/register', data={'username': username, 'email': f'{username}@example.com', 'password': password, 'confirm': password})
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
@@ -0,0 +1,118 @@
+import io
+import json
+
+import pytest
+
+import bulk
+from conftest import add_item
+from db import query
+
+
+def import_file(tmp_path, text, fmt='csv'):
+    path = tmp_path / f'items.{fmt}'
+    path.write_text(text)
+    return bulk.run_import(bulk.create_job(path.name, fmt), str(path), fmt)
+
+
+@pytest.mark.parametrize('record, error', [
+    ({'price': '1'}, 'Missing name'),
+    ({'name': 'Mug', 'price': 'abc'}, "Invalid price 'abc'"),
+    ({'name': 'Mug', 'price': '-1'}, 'Invalid price -1.0'),
+    ({'name': 'Mug', 'price': 'nan'}, 'Invalid price nan'),
+    ({'name': 'Mug', 'price': '1', 'item_id': 'x'}, "Invalid item_id 'x'"),
+    ({'name': 'Mug', 'price': '1', 'item_id': '0'}, 'Invalid item_id 0'),
+    ({'name': 'Mug', 'price': '1', 'item_id': '99999999999999999999'}, 'Invalid item_id 99999999999999999999'),
+    ({'name': 'Mug', 'price': '1', 'item_id': 7.5}, 'Invalid item_id 7.5'),
+    ({'name': 'Mug', 'price': '1', 'item_id': True}, 'Invalid item_id True'),
+    (None, 'Not a JSON object'),
+])
+def test_invalid_records(record, error):
+    with pytest.raises(ValueError, match=error.replace('(', r'\(')):
+        bulk.parse_item(record)
+
+
+def test_valid_record():
+    assert bulk.parse_item({'item_id': '7', 'name': ' Mug ', 'price': '2.50'}) == (7, 'Mug', None, 2.5)
+
+
+def test_csv_import_counts_and_upserts(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, 'BATCH_SIZE', 2)
+    existing = add_item('Old', 1)
+    job = import_file(tmp_path, (
+        'item_id,name,description,price\n'
+        f'{existing},New name,d,5\n'
+        ',Added,d,2\n'
+        ',,d,2\n'
+        '50,Chosen id,d,3\n'
+        '50,Chosen id again,d,4\n'
+    ))
+
+    assert job['status'] == 'done'
+    assert (job['rows_read'], job['inserted'], job['updated'], job['failed']) == (5, 2, 2, 1)
+    assert job['errors'] == [{'line': 4, 'error': 'Missing name'}]
+    items = {row['item_id']: (row['name'], row['price']) for row in query('SELECT * FROM Items')}
+    assert items[existing] == ('New name', 5)
+    assert items[50] == ('Chosen id again', 4)
+    assert len(items) == 3
+
+
+def test_out_of_range_id_only_fails_its_row(app, tmp_path):
+    job = import_file(tmp_path, 'item_id,name,price\n,Good,1\n99999999999999999999,Bad,2\n,Good2,3\n')
+
+    assert (job['status'], job['inserted'], job['failed']) == ('done', 2, 1)
+    assert [row['name'] for row in query('SELECT name FROM Items ORDER BY item_id')] == ['Good', 'Good2']
+
+
+def test_jsonl_import_skips_bad_lines(app, tmp_path):
+    job = import_file(tmp_path, '{"name": "Mug", "price": 3}\nnot json\n\n[1, 2]\n', 'jsonl')
+
+    assert (job['rows_read'], job['inserted'], job['failed']) == (3, 1, 2)
+    assert [error['line'] for error in job['errors']] == [2, 4]
+
+
+def test_csv_without_required_columns_fails(app, tmp_path):
+    job = import_file(tmp_path, 'title,cost\nMug,3\n')
+
+    assert job['status'] == 'failed'
+    assert 'name, price' in job['message']
+    assert query('SELECT * FROM Items') == []
+
+
+def test_errors_are_capped(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, 'MAX_ERRORS', 2)
+    job = import_file(tmp_path, 'name,price\n' + ',1\n' * 5)
+
+    assert job['failed'] == 5
+    assert len(job['errors']) == 2
+
+
+def test_upload_reports_progress(client, admin_headers):
+    headers = dict(admin_headers, Accept='application/json')
+    data = {'file': (io.BytesIO(b'name,price\nMug,3\n'), 'items.csv')}
+
+    response = client.post('/admin/import', data=data, headers=headers, content_type='multipart/form-data')
+    assert response.status_code == 202
+    # Imports run one at a time, so this waits for the one above
+    bulk._executor.submit(lambda: None).result()
+
+    job = client.get(response.json['status_url'], headers=headers).json
+    assert (job['status'], job['inserted']) == ('done', 1)
+
+
+def test_upload_rejects_unknown_format(client, admin_headers):
+    data = {'file': (io.BytesIO(b'x'), 'items.txt')}
+    response = client.post('/admin/import', data=data, headers=dict(admin_headers, Accept='application/json'), content_type='multipart/form-data')
+    assert response.status_code == 400
+
+
+def test_export_streams_every_row(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(bulk, 'EXPORT_BATCH_SIZE', 2)
+    for n in range(5):
+        add_item(f'Item {n}', n)
+
+    csv_lines = client.get('/admin/export/items', headers=admin_headers).get_data(as_text=True).splitlines()
+    jsonl_lines = client.get('/admin/export/items?format=jsonl', headers=admin_headers).get_data(as_text=True).splitlines()
+
+    assert csv_lines[0] == 'item_id,name,description,price,image'
+    assert len(csv_lines) == 6
+    assert [json.loads(line)['name'] for line in jsonl_lines] == [f'Item {n}' for n in range(5)]
@@ -0,0 +1,80 @@
+import pytest
+
+import cart
+from conftest import add_item, log_in
+from db import query
+
+
+def cart_of(client):
+    return {item['item_id']: item['qty'] for item in client.get('/api/cart').json['items']}
+
+
+def test_post_adds_to_existing_quantities(client):
+    mug = add_item()
+    client.post('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 2}]})
+    response = client.post('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 3}]})
+
+    assert response.json['items'][0]['qty'] == 5
+    assert response.json['total'] == 50
+
+
+def test_put_sets_quantities_and_zero_removes(client):
+    mug, bowl = add_item('Mug'), add_item('Bowl')
+    client.post('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 2}, {'item_id': bowl, 'qty': 1}]})
+
+    client.put('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 7}, {'item_id': bowl, 'qty': 0}]})
+
+    assert cart_of(client) == {mug: 7}
+
+
+def test_delete_removes_items(client):
+    mug, bowl = add_item('Mug'), add_item('Bowl')
+    client.post('/api/cart/items', json={'items': [{'item_id': mug}, {'item_id': bowl}]})
+
+    client.delete('/api/cart/items', json={'items': [{'item_id': mug}]})
+
+    assert cart_of(client) == {bowl: 1}
+
+
+@pytest.mark.parametrize('entry', [
+    {'item_id': 1, 'qty': 0},
+    {'item_id': 1, 'qty': -1},
+    {'item_id': '1'},
+    {'item_id': 1, 'qty': 1.5},
+    {'item_id': 2 ** 63},
+    {'item_id': 1, 'qty': 2 ** 63},
+])
+def test_post_rejects_invalid_quantities(client, entry):
+    add_item()
+    response = client.post('/api/cart/items', json={'items': [entry]})
+
+    assert response.status_code == 400
+    assert cart_of(client) == {}
+
+
+def test_add_to_cart_link_with_huge_id_is_not_found(client):
+    assert client.get('/add_to_cart/99999999999999999999').status_code == 404
+
+
+def test_unknown_items_are_ignored(client):
+    client.post('/api/cart/items', json={'items': [{'item_id': 999}]})
+    assert cart_of(client) == {}
+
+
+def test_add_skips_zero_quantities(app):
+    owner = cart.Owner('Cart', 'user_id', 'alice')
+    cart.add(owner, {add_item(): 0})
+    assert cart.items(owner) == []
+
+
+def test_guest_cart_is_merged_on_login(client):
+    mug = add_item()
+    log_in(client, 'alice')
+    client.post('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 2}]})
+    client.get('/logout')
+
+    client.post('/api/cart/items', json={'items': [{'item_id': mug, 'qty': 3}]})
+    client.post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    assert cart_of(client) == {mug: 5}
+    assert query('SELECT * FROM Guest_Carts') == []
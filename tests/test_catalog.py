@@ -0,0 +1,36 @@
+import pytest
+
+import catalog
+from conftest import add_item
+
+
+def test_pages_follow_cursor(app):
+    ids = [add_item(f'Item {n}', n) for n in range(5)]
+
+    first, cursor = catalog.get_page('price', limit=3)
+    second, last = catalog.get_page('price', cursor, limit=3)
+
+    assert [row['item_id'] for row in first + second] == ids
+    assert last is None
+
+
+@pytest.mark.parametrize('sort, cursor', [
+    ('id', 'x'),
+    ('id', '99999999999999999999'),
+    ('-id', '-99999999999999999999'),
+    ('price', '1'),
+    ('price', '1:99999999999999999999'),
+])
+def test_bad_cursor_is_ignored(sort, cursor):
+    assert catalog.parse_cursor(sort, cursor) is None
+
+
+@pytest.mark.parametrize('query', ['after=99999999999999999999', 'sort=price&after=1:99999999999999999999'])
+def test_out_of_range_cursor_shows_first_page(client, query):
+    add_item()
+    assert client.get(f'/catalog?{query}').status_code == 200
+
+
+@pytest.mark.parametrize('item_id', [999, 99999999999999999999])
+def test_missing_product_is_not_found(client, item_id):
+    assert client.get(f'/product/{item_id}').status_code == 404
@@ -0,0 +1,88 @@
+import pytest
+import stripe
+
+import cart
+import checkout
+import payments
+from conftest import add_item, log_in
+from db import query, transaction
+
+
+def fill_cart(username, quantities):
+    cart.add(cart.Owner('Cart', 'user_id', username), quantities)
+
+
+def test_place_order_copies_cart_and_clears_it(app):
+    mug, bowl = add_item('Mug', 10), add_item('Bowl', 2.5)
+    fill_cart('alice', {mug: 2, bowl: 4})
+
+    order_id, total = checkout.place_order('alice', 'Somewhere', '123')
+
+    assert total == 30
+    order = query('SELECT item_count, total FROM Orders WHERE order_id = ?', (order_id,), one=True)
+    assert (order['item_count'], order['total']) == (6, 30)
+    lines = {row['item_id']: (row['qty'], row['price']) for row in query('SELECT * FROM Order_Items WHERE order_id = ?', (order_id,))}
+    assert lines == {mug: (2, 10), bowl: (4, 2.5)}
+    assert query('SELECT * FROM Cart WHERE user_id = ?', ('alice',)) == []
+
+
+def test_empty_cart_is_refused(app):
+    with pytest.raises(checkout.EmptyCartError):
+        checkout.place_order('alice', 'Somewhere', '123')
+    assert query('SELECT * FROM Orders') == []
+
+
+def test_repeated_key_returns_the_same_order(app):
+    fill_cart('alice', {add_item(): 1})
+
+    first = checkout.place_order('alice', 'Somewhere', '123', idempotency_key='k1')
+    # The cart is empty now, so a second order could not be placed
+    second = checkout.place_order('alice', 'Somewhere', '123', idempotency_key='k1')
+
+    assert first == second
+    assert len(query('SELECT * FROM Orders')) == 1
+
+
+def test_keys_are_per_user(app):
+    item = add_item()
+    fill_cart('alice', {item: 1})
+    fill_cart('bob', {item: 3})
+
+    alice_order, _ = checkout.place_order('alice', 'Somewhere', '123', idempotency_key='k1')
+    bob_order, bob_total = checkout.place_order('bob', 'Elsewhere', '456', idempotency_key='k1')
+
+    assert alice_order != bob_order
+    assert bob_total == 30
+
+
+def test_failure_rolls_back_order_and_keeps_cart(app):
+    item = add_item()
+    fill_cart('alice', {item: 1})
+    with transaction() as conn:
+        conn.execute("CREATE TRIGGER fail_keys BEFORE INSERT ON Checkout_Keys BEGIN SELECT RAISE(ABORT, 'boom'); END")
+
+    with pytest.raises(Exception, match='boom'):
+        checkout.place_order('alice', 'Somewhere', '123', idempotency_key='k1')
+
+    assert query('SELECT * FROM Orders') == []
+    assert query('SELECT * FROM Order_Items') == []
+    assert [row['item_id'] for row in query('SELECT * FROM Cart WHERE user_id = ?', ('alice',))] == [item]
+
+
+def test_resubmitted_checkout_form_pays_once_per_order(app, client):
+    log_in(client)
+    client.get(f'/add_to_cart/{add_item()}')
+    form = {'name': 'Alice', 'email': 'a@example.com', 'address': 'Somewhere', 'phone': '123', 'idempotency_key': 'form-1'}
+
+    assert client.post('/checkout', data=form).status_code == 303
+    assert client.post('/checkout', data=form).status_code == 303
+
+    sessions = app.extensions['payment_gateway'].sessions
+    assert len(query('SELECT * FROM Orders')) == 1
+    assert {session['order_id'] for session in sessions} == {query('SELECT order_id FROM Orders', one=True)['order_id']}
+
+
+def test_stripe_timeout_is_per_gateway(monkeypatch):
+    monkeypatch.setattr(stripe, 'default_http_client', None)
+    payments.StripeGateway('sk_test_key', timeout=1)
+    assert stripe.default_http_client is None
@@ -0,0 +1,46 @@
+import io
+import os
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import images
+from conftest import add_item
+from db import query
+
+
+def png(size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(client, headers, item_id, data, filename):
+    return client.post(f'/admin/modify/{item_id}', headers=headers, content_type='multipart/form-data',
+                       data={'name': 'Mug', 'price': '5', 'description': 'd', 'image': (io.BytesIO(data), filename)})
+
+
+def test_non_image_is_rejected_before_storing(client, admin_headers):
+    item_id = add_item()
+
+    response = upload(client, admin_headers, item_id, b'not an image', 'photo.jpg')
+
+    assert response.status_code == 302
+    assert response.location.endswith(f'/admin/modify/{item_id}')
+    assert not os.path.exists(os.path.join(images._image_dir, 'originals'))
+    with client.session_transaction() as session:
+        assert session['_flashes'] == [('error', 'photo.jpg is not a valid image')]
+    assert query('SELECT name FROM Items WHERE item_id = ?', (item_id,), one=True)['name'] == 'Mug'
+
+
+def test_variants_are_made_and_attached(client, admin_headers):
+    item_id = add_item()
+    key, path = images.save_original(FileStorage(io.BytesIO(png()), 'a.png'))
+
+    images.process(item_id, key, path)
+
+    assert query('SELECT image FROM Items WHERE item_id = ?', (item_id,), one=True)['image'] == key
+    response = client.get(f"/media/{images.variant_name(key, 'thumb', 'webp')}")
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert max(Image.open(io.BytesIO(response.data)).size) == images.VARIANTS['thumb']
@@ -0,0 +1,12 @@
+def test_metrics_require_admin(client, admin_headers):
+    client.get('/catalog')
+
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers=admin_headers)
+    assert response.status_code == 200
+    assert 'route="/catalog"' in response.get_data(as_text=True)
+
+
+def test_server_timing_header(client):
+    timing = client.get('/catalog').headers['Server-Timing']
+    assert 'db;dur=' in timing and 'total;dur=' in timing
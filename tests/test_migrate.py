@@ -0,0 +1,10 @@
+import migrate
+
+
+def test_hot_queries_use_indexes(app):
+    assert migrate.full_scans() == []
+
+
+def test_unindexed_query_is_reported(app, monkeypatch):
+    monkeypatch.setattr(migrate, 'HOT_QUERIES', (('by name', 'SELECT * FROM Items WHERE name = ?'),))
+    assert migrate.full_scans() == [('by name', 'SCAN Items')]
@@ -0,0 +1,41 @@
+from conftest import add_item, log_in
+
+
+def test_unchanged_page_is_not_modified(client):
+    add_item()
+    etag = client.get('/catalog').headers['ETag']
+
+    assert client.get('/catalog', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_catalog_change_gives_new_page(client, admin_headers):
+    item_id = add_item('Mug')
+    etag = client.get(f'/product/{item_id}').headers['ETag']
+    client.post(f'/admin/modify/{item_id}', headers=admin_headers, data={'name': 'Bowl', 'price': '5', 'description': 'd'})
+
+    response = client.get(f'/product/{item_id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert b'Bowl' in response.data
+
+
+def test_login_changes_etag(client):
+    add_item()
+    guest = client.get('/catalog')
+    log_in(client)
+
+    response = client.get('/catalog', headers={'If-None-Match': guest.headers['ETag']})
+
+    assert response.status_code == 200
+    assert b'Logout' in response.data
+
+
+def test_if_modified_since_alone_renders_page(client):
+    add_item()
+    guest = client.get('/catalog')
+    log_in(client)
+
+    response = client.get('/catalog', headers={'If-Modified-Since': guest.headers['Last-Modified']})
+
+    assert response.status_code == 200
+    assert b'Logout' in response.data
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+import passwords
+from conftest import log_in
+from db import query
+
+
+@pytest.fixture
+def method():
+    """Switch the configured hashing method for one test."""
+    original = dict(passwords._config)
+
+    def use(name):
+        passwords._config['method'] = name
+        passwords._config.pop('prefix', None)
+
+    yield use
+    passwords._config.clear()
+    passwords._config.update(original)
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """Record every full password check."""
+    calls = []
+    check = passwords.check_password
+    monkeypatch.setattr(passwords, 'check_password', lambda hashed, password: calls.append(hashed) or check(hashed, password))
+    return calls
+
+
+@pytest.mark.parametrize('name', ['scrypt', 'pbkdf2:sha256', 'pbkdf2:sha256:1000'])
+def test_short_method_names_do_not_force_rehash(method, name):
+    method(name)
+    assert not passwords.needs_rehash(passwords.hash_password('secret'))
+
+
+def test_other_method_needs_rehash(method):
+    hashed = passwords.hash_password('secret')
+    method('scrypt')
+    assert passwords.needs_rehash(hashed)
+
+
+def test_login_rehashes_once_after_method_change(client, method):
+    log_in(client)
+    method('pbkdf2:sha256:2000')
+    client.get('/logout')
+
+    client.post('/login', data={'username': 'alice', 'password': 'secret'})
+    rehashed = query('SELECT password FROM Users', one=True)['password']
+    client.get('/logout')
+    client.post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    assert rehashed.startswith('pbkdf2:sha256:2000$')
+    assert query('SELECT password FROM Users', one=True)['password'] == rehashed
+
+
+def test_failed_logins_are_throttled_per_user(client, app):
+    log_in(client)
+    client.get('/logout')
+    for _ in range(app.config['LOGIN_MAX_FAILURES']):
+        assert client.post('/login', data={'username': 'alice', 'password': 'wrong'}).status_code == 200
+
+    # Even the right password is refused until the window passes
+    response = client.post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_failed_logins_are_throttled_per_ip(client, app, checks):
+    for n in range(app.config['LOGIN_MAX_FAILURES_PER_IP']):
+        client.post('/login', data={'username': f'user{n}', 'password': 'wrong'})
+
+    assert client.post('/login', data={'username': 'someone', 'password': 'wrong'}).status_code == 429
+    assert checks == []
+
+
+def test_basic_auth_success_is_cached(client, admin_headers, checks):
+    for _ in range(3):
+        assert client.get('/admin', headers=admin_headers).status_code == 200
+    assert len(checks) == 1
+
+
+def test_basic_auth_failures_are_not_cached(client, checks):
+    headers = {'Authorization': 'Basic YWRtaW46d3Jvbmc='}  # admin:wrong
+    for _ in range(2):
+        assert client.get('/admin', headers=headers).status_code == 401
+    assert len(checks) == 2
+
+
+def test_basic_auth_throttling(client, app, admin_headers):
+    wrong = {'Authorization': 'Basic YWRtaW46d3Jvbmc='}
+    # Requests without credentials are not failed attempts
+    for _ in range(10):
+        assert client.get('/admin').status_code == 401
+    for _ in range(app.config['LOGIN_MAX_FAILURES']):
+        client.get('/admin', headers=wrong)
+
+    # The failing address is locked out, even with the right password
+    assert client.get('/admin', headers=wrong).status_code == 429
+    assert client.get('/admin', headers=admin_headers).status_code == 429
+
+
+def test_basic_auth_failures_do_not_lock_out_other_addresses(client, app, admin_headers):
+    wrong = {'Authorization': 'Basic YWRtaW46d3Jvbmc='}
+    for _ in range(app.config['LOGIN_MAX_FAILURES']):
+        client.get('/admin', headers=wrong, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    assert client.get('/admin', headers=wrong, environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 429
+    assert client.get('/admin', headers=admin_headers, environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_full_hashing_queue_is_refused(client, monkeypatch):
+    log_in(client)
+    client.get('/logout')
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(passwords, '_slots', slots)
+    monkeypatch.setattr(passwords, '_executor', object())
+
+    response = client.post('/login', data={'username': 'alice', 'password': 'secret'})
+
+    assert response.status_code == 503
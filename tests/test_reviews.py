@@ -0,0 +1,29 @@
+import pytest
+
+import reviews
+from conftest import add_item
+
+
+@pytest.fixture
+def item(app):
+    item_id = add_item()
+    for rating in range(1, 6):
+        reviews.add_review(item_id, 'alice', rating, f'Review {rating}')
+    return item_id
+
+
+def test_pages_run_newest_first(item):
+    first, before = reviews.get_page(item, limit=3)
+    second, last = reviews.get_page(item, before, limit=3)
+
+    assert [row['rating'] for row in first + second] == [5, 4, 3, 2, 1]
+    assert last is None
+
+
+def test_out_of_range_cursor_is_clamped(item):
+    assert len(reviews.get_page(item, 10 ** 20)[0]) == 5
+    assert reviews.get_page(item, -10 ** 20)[0] == []
+
+
+def test_product_page_with_huge_cursor(client, item):
+    assert client.get(f'/product/{item}?before=99999999999999999999').status_code == 200
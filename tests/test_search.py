@@ -0,0 +1,29 @@
+import catalog
+import search_index
+from conftest import add_item
+from db import query
+
+
+def names(text):
+    return [row['name'] for row in search_index.search(text)[0]]
+
+
+def test_renamed_item_is_found_by_its_new_name(app):
+    item = add_item('Blue mug')
+    with catalog.changing() as conn:
+        conn.execute('UPDATE Items SET name = ?, description = ? WHERE item_id = ?', ('Red bowl', 'Red bowl', item))
+
+    assert names('bowl') == ['Red bowl']
+    assert names('mug') == []
+
+
+def test_price_change_does_not_reindex(app):
+    trigger = query("SELECT sql FROM sqlite_master WHERE name = 'Items_fts_update'", one=True)['sql']
+    assert 'UPDATE OF item_id, name, description' in trigger
+
+
+def test_deep_page_is_capped(client):
+    add_item('Mug')
+    response = client.get('/search?query=mug&page=99999999999999999999')
+
+    assert response.status_code == 200
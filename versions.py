@@ -0,0 +1,65 @@
+"""
+Shared change counters
+
+The Versions table keeps a counter per kind of data ('catalog', 'reviews')
+that every write bumps inside its own transaction, along with the time of
+the change. Workers read all counters in one query, at most every
+CHECK_INTERVAL seconds, and use them to tag caches and build ETags, so a
+change made by one worker reaches the others within that interval.
+"""
+
+import datetime
+import threading
+import time
+
+from db import query
+
+# Seconds between reads of the Versions table
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_checked_at = 0.0
+_versions = {}
+
+
+def _refresh():
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_INTERVAL:
+        return _versions
+    rows = query('SELECT name, version, updated_at FROM Versions')
+    versions = {}
+    for row in rows:
+        updated_at = None
+        if row['updated_at']:
+            updated_at = datetime.datetime.strptime(row['updated_at'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=datetime.timezone.utc)
+        versions[row['name']] = (row['version'], updated_at)
+    with _lock:
+        _versions.clear()
+        _versions.update(versions)
+        _checked_at = now
+    return _versions
+
+
+def version(name):
+    """Return the current counter for name."""
+    return _refresh().get(name, (0, None))[0]
+
+
+def last_modified(*names):
+    """Return the latest change time among names, or None if unknown."""
+    versions = _refresh()
+    times = [versions[name][1] for name in names if name in versions and versions[name][1]]
+    return max(times) if times else None
+
+
+def bump(conn, name):
+    """Record a change to name; call inside the transaction making the change."""
+    conn.execute("UPDATE Versions SET version = version + 1, updated_at = strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE name = ?", (name,))
+
+
+def invalidate():
+    """Force the next lookup to re-read the Versions table."""
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0